@@ -0,0 +1,116 @@
+"""Status-read latency under concurrent writers.
+
+Compares the run_store connection pool (WAL, connections shared across
+threads) with the old open-a-connection-per-call access pattern. Like the
+threaded dev server, every read runs on a new thread.
+
+    python bench_run_store.py --writers 4 --readers 8 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+import run_store
+
+
+def legacy_get_status(run_id):
+    # What get_run_status did before run_store: connect + CREATE TABLE per call
+    conn = sqlite3.connect(run_store.DB_FILE)
+    cursor = conn.cursor()
+    cursor.executescript(run_store.MIGRATIONS[0])
+    conn.commit()
+    cursor.execute(run_store.SELECT_STATUS, (run_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+
+def writer(db_file, run_ids, stop):
+    run_store.DB_FILE = db_file
+    i = 0
+    while not stop.is_set():
+        run_id = run_ids[i % len(run_ids)]
+        run_store.finish_run(run_id, 'running', (i % 100) / 100)
+        i += 1
+
+
+def read_once(get_status, run_id, latencies, errors):
+    start = time.perf_counter()
+    try:
+        get_status(run_id)
+        latencies.append(time.perf_counter() - start)
+    except sqlite3.OperationalError:
+        errors.append(1)
+
+
+def reader(get_status, run_ids, stop, latencies, errors):
+    i = 0
+    while not stop.is_set():
+        # One thread per request, as werkzeug's threaded server does
+        t = threading.Thread(target=read_once, args=(get_status, run_ids[i % len(run_ids)], latencies, errors))
+        t.start()
+        t.join()
+        i += 1
+
+
+def run(mode, db_file, args):
+    run_store.DB_FILE = db_file
+    run_ids = [str(uuid.uuid4()) for _ in range(100)]
+    for run_id in run_ids:
+        run_store.create_run(run_id, status='running')
+    run_store.close_pool()
+
+    stop = multiprocessing.Event()
+    writers = [multiprocessing.Process(target=writer, args=(db_file, run_ids, stop)) for _ in range(args.writers)]
+    for p in writers:
+        p.start()
+
+    get_status = run_store.get_status if mode == 'run_store' else legacy_get_status
+    latencies, errors = [], []
+    thread_stop = threading.Event()
+    readers = [threading.Thread(target=reader, args=(get_status, run_ids, thread_stop, latencies, errors))
+               for _ in range(args.readers)]
+    for t in readers:
+        t.start()
+    time.sleep(args.seconds)
+    thread_stop.set()
+    for t in readers:
+        t.join()
+    stop.set()
+    for p in writers:
+        p.join()
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f'{mode:>10}: {len(latencies) / args.seconds:9.0f} reads/s  p50={p50:.3f}ms  p99={p99:.3f}ms  errors={len(errors)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('legacy', 'run_store'):
+            db_file = os.path.join(tmp, f'{mode}.db')
+            run_store.DB_FILE = db_file
+            run_store.migrate()
+            if mode == 'legacy':
+                # The old database was never switched to WAL
+                conn = sqlite3.connect(db_file)
+                conn.execute('PRAGMA journal_mode = DELETE')
+                conn.close()
+            run(mode, db_file, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import run_store
+
+# Long-poll and SSE clients wait on one shared watcher instead of each polling runs.db.
+# The watcher checks PRAGMA data_version (which changes whenever another connection
+# commits, including the pool workers) and only then re-reads the runs being waited on.
+
+POLL_INTERVAL = float(os.getenv('RUN_EVENTS_POLL_INTERVAL', 0.2))
+MAX_WAIT = 60
+HEARTBEAT_INTERVAL = 15
+
+logger = logging.getLogger(__name__)
+
+
+class RunNotifier:
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.cond = threading.Condition()
+        self.waiters = {}
+        self.snapshots = {}
+        self.thread = None
+
+    def wait_for_change(self, run_id, last, timeout):
+        """Block until the (status, progress) of run_id differs from last or timeout passes.
+
+        Returns the newest snapshot.
+        """
+        self._ensure_watcher()
+        with self.cond:
+            self.waiters[run_id] = self.waiters.get(run_id, 0) + 1
+            # Runs only move forward, so of two waiters' reads the later one is current
+            if _progressed(last, self.snapshots.get(run_id)):
+                self.snapshots[run_id] = last
+            try:
+                self.cond.wait_for(lambda: self.snapshots.get(run_id) != last, timeout)
+                return self.snapshots.get(run_id)
+            finally:
+                self.waiters[run_id] -= 1
+                if not self.waiters[run_id]:
+                    del self.waiters[run_id]
+                    self.snapshots.pop(run_id, None)
+
+    def _ensure_watcher(self):
+        with self.cond:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._watch, name='run-watcher', daemon=True)
+                self.thread.start()
+
+    def _watch(self):
+        conn = run_store.connect()
+        data_version = None
+        known = set()
+        while True:
+            time.sleep(self.poll_interval)
+            with self.cond:
+                run_ids = list(self.waiters)
+            if not run_ids:
+                continue
+            try:
+                version = conn.execute('PRAGMA data_version').fetchone()[0]
+                # Newly watched runs are read once even if nothing was committed since the last poll
+                if version == data_version and known.issuperset(run_ids):
+                    continue
+                data_version = version
+                known = set(run_ids)
+                placeholders = ', '.join('?' * len(run_ids))
+                rows = conn.execute(f'SELECT run_id, status, progress FROM runs WHERE run_id IN ({placeholders})',
+                                    run_ids).fetchall()
+            except Exception as e:
+                logger.error(f'Run watcher failed to read runs.db: {e}')
+                continue
+            with self.cond:
+                changed = False
+                for run_id, status, progress in rows:
+                    if run_id in self.waiters and self.snapshots.get(run_id) != (status, progress):
+                        self.snapshots[run_id] = (status, progress)
+                        changed = True
+                if changed:
+                    self.cond.notify_all()
+
+
+def _progressed(snapshot, than):
+    """True if (status, progress) snapshot is further along in the run's life than than (or than is None)."""
+    return than is None or _position(snapshot) > _position(than)
+
+
+def _position(snapshot):
+    status, progress = snapshot
+    stage = 2 if is_terminal(status) else 1 if status == 'running' else 0
+    return stage, progress or 0.0
+
+
+notifier = RunNotifier()
+
+
+def is_terminal(status):
+    return status in run_store.TERMINAL_STATES
+
+
+def wait_for_status(run_id, wait):
+    """Current status of run_id, or the next change if it arrives within wait seconds."""
+    row = run_store.get_status(run_id)
+    if row is None:
+        return None
+    status, progress = row
+    if wait > 0 and not is_terminal(status):
+        status, progress = notifier.wait_for_change(run_id, (status, progress), min(wait, MAX_WAIT))
+    return {'status': status, 'progress': progress}
+
+
+def stream(run_id):
+    """Server-Sent Events for run_id: one 'status' event per transition, ending at a terminal state."""
+    row = run_store.get_status(run_id)
+    if row is None:
+        yield f'event: error\ndata: {json.dumps({"error": "Run not found"})}\n\n'
+        return
+    last = tuple(row)
+    while True:
+        status, progress = last
+        yield f'event: status\ndata: {json.dumps({"runId": run_id, "status": status, "progress": progress})}\n\n'
+        if is_terminal(status):
+            return
+        current = last
+        while current == last:
+            current = notifier.wait_for_change(run_id, last, HEARTBEAT_INTERVAL)
+            if current == last:
+                # Keeps proxies from closing an idle stream
+                yield ': heartbeat\n\n'
+        last = current
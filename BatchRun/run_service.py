@@ -1,15 +1,47 @@
+import base64
+import ctypes
+import json
 import logging
 from logging import config
-import sqlite3
 from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import signal
+import threading
 import time
 import os
 import uuid
 import psutil
+import run_store
+
+# Worker pool settings, overridable through the environment
+MAX_WORKERS = int(os.getenv('RUN_MAX_WORKERS', os.cpu_count() or 4))
+MAX_QUEUE = int(os.getenv('RUN_MAX_QUEUE', 500))
+# How long a kill request stays addressed to its run; a SIGTERM with no recent kill behind it is a shutdown
+KILL_GRACE = 5.0
+
+executor = None
+pending = {}
+pending_lock = threading.Lock()
+# Kill requests shared with the workers, one slot per worker pid, so a SIGTERM is only honoured by the
+# worker still running the run it was sent for
+kill_requests = None
+
+
+class KillRequest(ctypes.Structure):
+    _fields_ = [('pid', ctypes.c_int), ('run_id', ctypes.c_char * 64), ('time', ctypes.c_double)]
+
+
+class QueueFullError(Exception):
+    """Raised when the run queue is at its depth limit."""
+
+
+class RunKilled(Exception):
+    """Raised inside a worker when its current run is killed."""
 
 
 # Set up logging configuration
-def initialize():
+def initialize(max_workers=None, max_queue=None):
+    global executor, MAX_WORKERS, MAX_QUEUE, kill_requests
     logging.config.dictConfig({
         'version': 1,
         'formatters': {
@@ -30,91 +62,157 @@ def initialize():
         }
     })
 
+    if max_workers is not None:
+        MAX_WORKERS = max_workers
+    if max_queue is not None:
+        MAX_QUEUE = max_queue
+    run_store.migrate()
+    # One long-lived pool for the life of the service
+    if executor is None:
+        # Spare slots for workers the pool starts in place of ones that died
+        kill_requests = multiprocessing.Array(KillRequest, MAX_WORKERS * 2)
+        executor = ProcessPoolExecutor(max_workers=MAX_WORKERS, initializer=init_worker,
+                                       initargs=(kill_requests,))
+        logger.info(f'Worker pool started: max_workers={MAX_WORKERS}, max_queue={MAX_QUEUE}')
+
+
+def shutdown():
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
+
 logger = logging.getLogger(__name__)
 
-# Set up SQLite database connection
-def get_conn():
-    DB_FILE = 'runs.db'
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    # Create table to store run status
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS runs (
-            run_id TEXT PRIMARY KEY,
-            status TEXT,
-            progress REAL,
-            start_time REAL,
-            end_time REAL,
-            pid INTEGER
-        )
-    ''')
-    conn.commit()
-
-    return conn, cursor
+# Pool workers outlive a single run, so a kill must only end the current run
+current_run = None
+
+def init_worker(requests):
+    global kill_requests
+    kill_requests = requests
+    signal.signal(signal.SIGTERM, on_terminate)
+
+def take_kill_request(pid):
+    """run_id of a recent kill_run addressed to worker pid, clearing it; None if there is none."""
+    with kill_requests.get_lock():
+        for request in kill_requests:
+            if request.pid == pid:
+                request.pid = 0
+                if time.time() - request.time <= KILL_GRACE:
+                    return request.run_id.decode()
+    return None
+
+def add_kill_request(pid, run_id):
+    """Address the next SIGTERM of worker pid to run_id, in that worker's own slot."""
+    with kill_requests.get_lock():
+        now = time.time()
+        # The worker's slot if it has one, else a free or expired one
+        slot = next((r for r in kill_requests if r.pid == pid), None) or \
+            min(kill_requests, key=lambda r: r.time if r.pid else -1)
+        if slot.pid and slot.pid != pid and now - slot.time <= KILL_GRACE:
+            logger.warning(f'All kill slots busy, overwriting the request for worker {slot.pid}')
+        slot.pid, slot.run_id, slot.time = pid, run_id.encode(), now
+
+def on_terminate(signum, frame):
+    target = take_kill_request(os.getpid())
+    if target is None:
+        if current_run is None:
+            # Not a kill_run and nothing to stop: terminate the idle worker as usual
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+        raise RunKilled(current_run)
+    if target == current_run:
+        raise RunKilled(current_run)
+    # The kill was for a run this worker has already finished
+    logger.info(f'Ignoring kill for run {target}, worker is on {current_run}')
 
 def execute_run(run_id, run_type, cob_date, run_group, scenario):
+    global current_run
     try:
-        conn, cursor = get_conn()
         # Simulate work
         logger.info(f'Starting run {run_id}...')
-        cursor.execute('INSERT INTO runs (run_id, status, progress, start_time, pid) VALUES (?, ?, 0.0, ?, ?)', (run_id, 'running', time.time(), os.getpid()))
-        conn.commit()
-
-        # Simulate work using time.sleep
-        time.sleep(10)
+        current_run = run_id
+        if not run_store.mark_running(run_id, os.getpid()):
+            logger.info(f'Run {run_id} was killed before it started')
+            return
+
+        # Simulate work using time.sleep, reporting progress as we go
+        steps = 10
+        for step in range(1, steps + 1):
+            time.sleep(1)
+            report_progress(run_id, step / steps)
+        current_run = None
 
         # Update run status and progress
-        cursor.execute('UPDATE runs SET status = ?, progress = ?, end_time = ? WHERE run_id = ?', ('completed', 1.0, time.time(), run_id))
-        conn.commit()
+        run_store.finish_run(run_id, 'completed', 1.0)
 
         logger.info(f'Run {run_id} completed successfully!')
+    except RunKilled:
+        logger.info(f'Run {run_id} killed')
+        run_store.finish_run(run_id, 'killed')
     except Exception as e:
         logger.error(f'Error running {run_id}: {e}')
-        cursor.execute('UPDATE runs SET status = ?, end_time = ? WHERE run_id = ?', ('failed', time.time(), run_id))
-        conn.commit()
+        run_store.finish_run(run_id, 'failed')
     finally:
-        conn.close()
+        current_run = None
+
+def report_progress(run_id, progress):
+    """Record run progress (0.0-1.0). Cheap enough to call on every tick; writes are batched."""
+    run_store.report_progress(run_id, progress)
 
 def start_run(run_type, cob_date, run_group, scenario):
-    # Create a new run ID
-    run_id = str(uuid.uuid4())
-    logger.info(f'Creating new run: {run_id}')
+    """Queue a run on the worker pool and return its runId without waiting."""
+    if executor is None:
+        raise RuntimeError('run_service.initialize() has not been called')
+
+    with pending_lock:
+        if len(pending) >= MAX_QUEUE:
+            raise QueueFullError(f'{len(pending)} runs already queued or running')
+        # Create a new run ID
+        run_id = str(uuid.uuid4())
+        logger.info(f'Creating new run: {run_id}')
+
+        run_store.create_run(run_id, run_type, cob_date, run_group, scenario)
 
-    # Start the run in a new process
-    with ProcessPoolExecutor() as executor:
         future = executor.submit(execute_run, run_id, run_type, cob_date, run_group, scenario)
-        future.result()
+        pending[run_id] = future
+    future.add_done_callback(lambda f: run_finished(run_id, f))
 
     return run_id
 
+def run_finished(run_id, future):
+    with pending_lock:
+        pending.pop(run_id, None)
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f'Worker for run {run_id} failed: {future.exception()}')
+
 def kill_run(run_id):
     try:
-        conn, cursor = get_conn()
-        # Get the PID of the process
-        cursor.execute('SELECT pid FROM runs WHERE run_id = ?', (run_id,))
-        row = cursor.fetchone()
-        if row:
-            pid = row[0]
-            # Kill the process
-            process = psutil.Process(pid)
-            process.terminate()
-            # Update the run status
-            cursor.execute('UPDATE runs SET status = ? WHERE run_id = ?', ('killed', run_id))
-            conn.commit()
-            logger.info(f'Run {run_id} killed successfully!')
-        else:
+        if run_store.get_pid(run_id) is None:
             logger.error(f'Run {run_id} not found')
+            return
+        # Marked first: a queued run then never starts, and a running one cannot end as completed
+        if not run_store.finish_run(run_id, 'killed'):
+            logger.info(f'Run {run_id} already finished, nothing to kill')
+            return
+        future = pending.get(run_id)
+        if future is not None and future.cancel():
+            # Still waiting for a worker slot
+            pass
+        else:
+            # Read after marking: a run that was queued a moment ago may have started since
+            pid = run_store.get_pid(run_id)[0]
+            if pid:
+                # SIGTERM is turned into RunKilled by the worker, which stays in the pool
+                add_kill_request(pid, run_id)
+                psutil.Process(pid).terminate()
+        logger.info(f'Run {run_id} killed successfully!')
     except Exception as e:
         logger.error(f'Error killing run {run_id}: {e}')
-    finally:
-        conn.close()
 
 def get_run_status(run_id):
-    conn, cursor = get_conn()
-    cursor.execute('SELECT status, progress FROM runs WHERE run_id = ?', (run_id,))
-    row = cursor.fetchone()
-    conn.close()
+    row = run_store.get_status(run_id)
     if row:
         status = row[0]
         progress = row[1]
@@ -122,15 +220,35 @@ def get_run_status(run_id):
     else:
         return {'error': 'Run not found'}
 
-def get_runs():
-    conn, cursor = get_conn()
-    cursor.execute('SELECT run_id, status, progress FROM runs')
-    rows = cursor.fetchall()
-    runs = []
-    conn.close()
-    for row in rows:
-        run_id = row[0]
-        status = row[1]
-        progress = row[2]
-        runs.append({'run_id': run_id, 'status': status, 'progress': progress})
-    return runs
\ No newline at end of file
+DEFAULT_FIELDS = ['run_id', 'status', 'progress']
+MAX_PAGE_SIZE = 500
+
+def get_runs(status=None, run_type=None, cob_date=None, run_group=None, since=None, until=None,
+             fields=None, limit=50, cursor=None):
+    """Return one page of runs, newest first, plus the cursor for the next page.
+
+    Raises ValueError for unknown fields or a malformed cursor.
+    """
+    filters = {'status': status, 'run_type': run_type, 'cob_date': cob_date, 'run_group': run_group}
+    filters = {column: value for column, value in filters.items() if value is not None}
+    fields = fields or DEFAULT_FIELDS
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+
+    rows = run_store.query_runs(filters, fields, limit, after=after, since=since, until=until)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['run_id'])
+    runs = [{field: row[field] for field in fields} for row in rows]
+    return {'runs': runs, 'next_cursor': next_cursor}
+
+def encode_cursor(created_at, run_id):
+    return base64.urlsafe_b64encode(json.dumps([created_at, run_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        created_at, run_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(created_at), str(run_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
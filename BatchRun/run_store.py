@@ -0,0 +1,295 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Repository for the runs table.
+# Connections are kept open in a small per-process pool and lent out per call,
+# so short-lived request threads (the threaded dev server starts one per
+# request) reuse them too. The statement cache of each connection acts as our
+# prepared statement pool: the SQL strings below are compiled once per
+# connection and reused.
+
+DB_FILE = os.getenv('RUN_DB', 'runs.db')
+BUSY_TIMEOUT_MS = int(os.getenv('RUN_DB_BUSY_TIMEOUT_MS', 5000))
+POOL_SIZE = int(os.getenv('RUN_DB_POOL_SIZE', 8))  # idle connections kept open per process
+WRITE_RETRIES = 3
+# Progress ticks are coalesced and flushed together on whichever threshold is hit first
+PROGRESS_FLUSH_INTERVAL = float(os.getenv('RUN_PROGRESS_FLUSH_INTERVAL', 1.0))
+PROGRESS_BATCH_SIZE = int(os.getenv('RUN_PROGRESS_BATCH_SIZE', 200))
+
+TERMINAL_STATES = ('completed', 'failed', 'killed')
+
+logger = logging.getLogger(__name__)
+
+# Schema migrations, applied in order; PRAGMA user_version records the last one applied
+MIGRATIONS = [
+    '''
+    CREATE TABLE IF NOT EXISTS runs (
+        run_id TEXT PRIMARY KEY,
+        status TEXT,
+        progress REAL,
+        start_time REAL,
+        end_time REAL,
+        pid INTEGER
+    );
+    ''',
+    # Run parameters and submission time, indexed for GET /runs
+    '''
+    ALTER TABLE runs ADD COLUMN run_type TEXT;
+    ALTER TABLE runs ADD COLUMN cob_date TEXT;
+    ALTER TABLE runs ADD COLUMN run_group TEXT;
+    ALTER TABLE runs ADD COLUMN scenario TEXT;
+    ALTER TABLE runs ADD COLUMN created_at REAL NOT NULL DEFAULT 0;
+    UPDATE runs SET created_at = COALESCE(start_time, 0);
+    CREATE INDEX IF NOT EXISTS idx_runs_created ON runs (created_at, run_id);
+    CREATE INDEX IF NOT EXISTS idx_runs_status ON runs (status, created_at, run_id);
+    CREATE INDEX IF NOT EXISTS idx_runs_type ON runs (run_type, created_at, run_id);
+    CREATE INDEX IF NOT EXISTS idx_runs_cob ON runs (cob_date, created_at, run_id);
+    CREATE INDEX IF NOT EXISTS idx_runs_group ON runs (run_group, created_at, run_id);
+    ''',
+]
+
+# Columns GET /runs may project, and the filters it may apply
+RUN_COLUMNS = ('run_id', 'status', 'progress', 'run_type', 'cob_date', 'run_group', 'scenario',
+               'created_at', 'start_time', 'end_time')
+RUN_FILTERS = ('status', 'run_type', 'cob_date', 'run_group')
+
+INSERT_RUN = '''INSERT INTO runs (run_id, status, progress, run_type, cob_date, run_group, scenario, created_at)
+                VALUES (?, ?, 0.0, ?, ?, ?, ?, ?)'''
+# Status changes are guarded so a run killed while queued is never started, and a terminal status is never overwritten
+MARK_RUNNING = "UPDATE runs SET status = ?, start_time = ?, pid = ? WHERE run_id = ? AND status = 'queued'"
+FINISH_RUN = f'''UPDATE runs SET status = ?, progress = COALESCE(?, progress), end_time = ?
+                 WHERE run_id = ? AND status NOT IN {TERMINAL_STATES}'''
+UPDATE_PROGRESS = "UPDATE runs SET progress = ? WHERE run_id = ? AND status = 'running'"
+SELECT_STATUS = 'SELECT status, progress FROM runs WHERE run_id = ?'
+SELECT_PID = 'SELECT pid, status FROM runs WHERE run_id = ?'
+
+def connect(db_file=None):
+    """Open a connection with the WAL / busy-timeout settings every caller should use."""
+    conn = sqlite3.connect(db_file or DB_FILE, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=64)
+    return configure(conn)
+
+
+def configure(conn):
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+
+class ConnectionPool:
+    """Idle connections of one process for one database file, handed out one caller at a time."""
+
+    def __init__(self, db_file, size=POOL_SIZE):
+        self.db_file = db_file
+        self.pid = os.getpid()
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            # Lent to one thread at a time, but not always the thread that opened it
+            conn = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=64,
+                                   check_same_thread=False)
+            configure(conn)
+        try:
+            yield conn
+        finally:
+            try:
+                self.idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def connection():
+    """Borrow a pooled connection for the duration of a with block."""
+    global _pool
+    with _pool_lock:
+        # Connections inherited through fork() must not be used by the child
+        if _pool is None or _pool.pid != os.getpid() or _pool.db_file != DB_FILE:
+            _pool = ConnectionPool(DB_FILE)
+        pool = _pool
+    return pool.connection()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.close()
+        _pool = None
+
+
+def migrate():
+    """Create or upgrade the schema. Called once at service start-up."""
+    conn = connect()
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for i, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.executescript(f'BEGIN; {script} PRAGMA user_version = {i}; COMMIT;')
+            logger.info(f'Applied runs schema migration {i}')
+    finally:
+        conn.close()
+
+
+def _write(sql, params, many=False):
+    # busy_timeout covers most contention; retry a few times if a writer still loses
+    for attempt in range(WRITE_RETRIES):
+        try:
+            with connection() as conn, conn:
+                if many:
+                    return conn.executemany(sql, params).rowcount
+                return conn.execute(sql, params).rowcount
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) or attempt == WRITE_RETRIES - 1:
+                raise
+            logger.warning(f'runs.db locked, retrying write ({attempt + 1}/{WRITE_RETRIES})')
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def create_run(run_id, run_type=None, cob_date=None, run_group=None, scenario=None, status='queued'):
+    _write(INSERT_RUN, (run_id, status, run_type, cob_date, run_group, scenario, time.time()))
+
+
+def mark_running(run_id, pid):
+    """Move a queued run to running. Returns False if it is no longer queued (e.g. killed while waiting)."""
+    return _write(MARK_RUNNING, ('running', time.time(), pid, run_id)) > 0
+
+
+def finish_run(run_id, status, progress=None):
+    """Set the run's status unless it already has a terminal one. Returns False if it did."""
+    # Terminal states are written straight away; any buffered tick for the run is stale
+    progress_buffer.discard(run_id)
+    return _write(FINISH_RUN, (status, progress, time.time(), run_id)) > 0
+
+
+class ProgressBuffer:
+    """Collects progress ticks in memory and writes them in one transaction.
+
+    Only the latest value per run is kept. A flush happens when the buffer
+    holds batch_size runs, when flush_interval has passed since the last one,
+    or from a background thread so the final ticks are not held back.
+    """
+
+    def __init__(self, flush_interval=PROGRESS_FLUSH_INTERVAL, batch_size=PROGRESS_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.flusher_pid = None
+
+    def report(self, run_id, progress):
+        self._ensure_flusher()
+        with self.lock:
+            self.pending[run_id] = progress
+            due = (len(self.pending) >= self.batch_size
+                   or time.monotonic() - self.last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def discard(self, run_id):
+        with self.lock:
+            self.pending.pop(run_id, None)
+
+    def flush(self):
+        with self.lock:
+            batch = [(progress, run_id) for run_id, progress in self.pending.items()]
+            self.pending.clear()
+            self.last_flush = time.monotonic()
+        if batch:
+            try:
+                _write(UPDATE_PROGRESS, batch, many=True)
+            except sqlite3.Error as e:
+                logger.error(f'Failed to flush progress for {len(batch)} runs: {e}')
+
+    def _ensure_flusher(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self.flusher_pid == os.getpid():
+            return
+        self.flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='progress-flusher', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+
+progress_buffer = ProgressBuffer()
+
+
+def report_progress(run_id, progress):
+    progress_buffer.report(run_id, progress)
+
+
+def flush_progress():
+    progress_buffer.flush()
+
+
+def get_status(run_id):
+    with connection() as conn:
+        return conn.execute(SELECT_STATUS, (run_id,)).fetchone()
+
+
+def get_pid(run_id):
+    with connection() as conn:
+        return conn.execute(SELECT_PID, (run_id,)).fetchone()
+
+
+def query_runs(filters, fields, limit, after=None, since=None, until=None):
+    """Page through runs, newest first.
+
+    filters maps RUN_FILTERS columns to required values, fields is the list of
+    RUN_COLUMNS to return and after is the (created_at, run_id) of the last
+    row of the previous page. Returns up to limit + 1 rows as dicts so the
+    caller can tell whether another page exists.
+    """
+    where, params = [], []
+    for column, value in filters.items():
+        if column not in RUN_FILTERS:
+            raise ValueError(f'Cannot filter on {column}')
+        where.append(f'{column} = ?')
+        params.append(value)
+    if since is not None:
+        where.append('created_at >= ?')
+        params.append(since)
+    if until is not None:
+        where.append('created_at < ?')
+        params.append(until)
+    if after is not None:
+        where.append('(created_at, run_id) < (?, ?)')
+        params.extend(after)
+
+    unknown = set(fields) - set(RUN_COLUMNS)
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+    # The keyset columns are always read so the next cursor can be built
+    columns = list(dict.fromkeys(['created_at', 'run_id', *fields]))
+    sql = f'SELECT {", ".join(columns)} FROM runs'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY created_at DESC, run_id DESC LIMIT ?'
+    params.append(limit + 1)
+
+    with connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(zip(columns, row)) for row in rows]
@@ -1,8 +1,10 @@
-from flask import Flask,request, redirect,url_for
+from flask import Flask,request, redirect,url_for, Response, stream_with_context
 from flask_cors import CORS
 from flask_restful import Api, Resource, reqparse
 from flask_swagger_ui import get_swaggerui_blueprint
+from datetime import datetime
 import run_service
+import run_events
 import logging
 
 #configure logging for the main process
@@ -45,7 +47,11 @@ class Run(Resource):
         scenario = args['scenario']
 
         logger.info(f"Strting new run: type={run_type}, cob_date={cob_date}, run_group={run_group}, scenario={scenario}")
-        runId = run_service.start_run(run_type,cob_date,run_group,scenario)
+        try:
+            runId = run_service.start_run(run_type,cob_date,run_group,scenario)
+        except run_service.QueueFullError as e:
+            logger.warning(f"Rejecting run, queue is full: {e}")
+            return {'message': 'Too many runs queued, retry later'}, 429, {'Retry-After': '5'}
         return {'runId': runId}, 201
     
 
@@ -54,10 +60,56 @@ class Run(Resource):
 class RunStatus(Resource):
     """Get the status of a run given a runId"""
     def get(self,runId):
-        logger.info(f"fetching status for run_id={runId}")
-        status = run_service.get_run_status(runId)
+        wait = request.args.get('wait', default=0, type=float)
+        logger.info(f"fetching status for run_id={runId} wait={wait}")
+        if wait > 0:
+            # Long poll: answer as soon as the status or progress changes
+            status = run_events.wait_for_status(runId, wait) or {'error': 'Run not found'}
+        else:
+            status = run_service.get_run_status(runId)
         return {'status':status},200
 
+# class to stream status changes of a run
+class RunEvents(Resource):
+    """Server-Sent Events stream of status/progress changes for a runId"""
+    def get(self,runId):
+        logger.info(f"streaming events for run_id={runId}")
+        return Response(stream_with_context(run_events.stream(runId)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def parse_time(value):
+    """Accept epoch seconds or an ISO 8601 timestamp."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+# class to list runs a page at a time
+class RunList(Resource):
+    """List runs, newest first, with filters, projection and keyset pagination"""
+    def get(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('status', type=str, location='args')
+        parser.add_argument('type', type=str, location='args')
+        parser.add_argument('cob_date', type=str, location='args')
+        parser.add_argument('run_group', type=str, location='args')
+        parser.add_argument('since', type=parse_time, location='args', help="since must be epoch seconds or ISO 8601")
+        parser.add_argument('until', type=parse_time, location='args', help="until must be epoch seconds or ISO 8601")
+        parser.add_argument('fields', type=str, location='args')
+        parser.add_argument('limit', type=int, default=50, location='args')
+        parser.add_argument('cursor', type=str, location='args')
+        args = parser.parse_args()
+
+        fields = [f.strip() for f in args['fields'].split(',') if f.strip()] if args['fields'] else None
+        logger.info(f"Listing runs: {dict((k, v) for k, v in args.items() if v is not None)}")
+        try:
+            page = run_service.get_runs(status=args['status'], run_type=args['type'], cob_date=args['cob_date'],
+                                        run_group=args['run_group'], since=args['since'], until=args['until'],
+                                        fields=fields, limit=args['limit'], cursor=args['cursor'])
+        except ValueError as e:
+            return {'message': str(e)}, 400
+        return page, 200
+
 class KillRun(Resource):
     """Kill a run given a runiD"""
     def post(self,runId):
@@ -66,7 +118,9 @@ class KillRun(Resource):
         return {'message': 'run killed successfully'},200
     
 api.add_resource(Run,'/run')
+api.add_resource(RunList,'/runs')
 api.add_resource(RunStatus,'/run/<string:runId>/status')
+api.add_resource(RunEvents,'/run/<string:runId>/events')
 api.add_resource(KillRun, '/run/<string:runId>/kill')
 
 if __name__ == '__main__':
@@ -1,11 +1,17 @@
 # app.py
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_restx import Api, Resource, fields
 import uuid
 import time
 import threading
 import os
+import json
 import yaml
+import log_files
+import response_cache
+import run_executor
+import run_store
+from run_store import Run, TERMINAL_STATES
 
 app = Flask(__name__)
 with open('open_api_specs/batchservice.yaml', 'r') as f:
@@ -15,25 +21,107 @@ api = Api(app, version='1.0', title='Batch Run API',
            **swagger_data
           )
 
-# Data structures to keep track of runs
-runs = {}
-run_logs = {}
+# Durable registry of runs, shared by all workers
+store = run_store.CachedRunStore(run_store.SQLiteRunStore())
 
-# Define the 'runs' namespace for endpoints
-runs_ns = api.namespace('runs', description='Operations related to runs')
+MAX_WAIT = 60
+HEARTBEAT_INTERVAL = 15
+# How often the status watcher checks for changes made by other workers, and running jobs check for remote kills
+STORE_POLL_INTERVAL = 1.0
+
+
+class StatusNotifier:
+    """Shared by every long-poll/SSE client; status changes go through set_status to wake them.
+
+    Changes made by other workers are picked up by one watcher thread, which only
+    reads the waited-on runs when another connection has committed to the store.
+    """
+
+    def __init__(self, poll_interval=STORE_POLL_INTERVAL):
+        self.cond = threading.Condition()
+        self.poll_interval = poll_interval
+        self.waiters = {}  # run_id -> number of clients waiting on it
+        self.snapshots = {}  # run_id -> newest status seen for it
+        self.thread = None
+
+    def set_status(self, run, status):
+        """Move run to status if its current status allows it. Returns whether it did."""
+        if not store.set_status(run, status):
+            return False
+        # Agents may hold this run's status, or results for its cob date, in their response cache
+        response_cache.invalidate_run(run.run_id, run.cob_date if status in TERMINAL_STATES else None)
+        with self.cond:
+            if run.run_id in self.waiters:
+                self.snapshots[run.run_id] = status
+            self.cond.notify_all()
+        return True
+
+    def wait_for_change(self, run_id, last, timeout):
+        """Block until the status of run_id differs from last or timeout passes. Returns the newest status."""
+        self._ensure_watcher()
+        with self.cond:
+            self.waiters[run_id] = self.waiters.get(run_id, 0) + 1
+            # Statuses only move forward, so of two clients' views the later one is current
+            if _lifecycle(last) > _lifecycle(self.snapshots.get(run_id)):
+                self.snapshots[run_id] = last
+            try:
+                self.cond.wait_for(lambda: self.snapshots.get(run_id) != last, timeout)
+                return self.snapshots.get(run_id)
+            finally:
+                self.waiters[run_id] -= 1
+                if not self.waiters[run_id]:
+                    del self.waiters[run_id]
+                    self.snapshots.pop(run_id, None)
 
+    def _ensure_watcher(self):
+        with self.cond:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._watch, name='status-watcher', daemon=True)
+                self.thread.start()
 
-class Run:
-    def __init__(self, run_id, run_type, run_scenario, cob_date, run_group):
-        self.run_id = run_id
-        self.status = "pending"
-        self.log_file = f"run_{run_id}.log"  # Simple log file path
-        self.run_type = run_type
-        self.run_scenario = run_scenario
-        self.cob_date = cob_date
-        self.run_group = run_group
+    def _watch(self):
+        data_version = None
+        known = set()
+        while True:
+            time.sleep(self.poll_interval)
+            with self.cond:
+                run_ids = list(self.waiters)
+            if not run_ids:
+                continue
+            try:
+                version = store.backend.data_version()
+                # Newly watched runs are read once even if nothing was committed since the last poll
+                if version == data_version and known.issuperset(run_ids):
+                    continue
+                data_version = version
+                known = set(run_ids)
+                statuses = store.backend.get_statuses(run_ids)
+            except Exception as e:
+                app.logger.error(f'Status watcher failed to read the run store: {e}')
+                continue
+            with self.cond:
+                changed = False
+                for run_id, status in statuses.items():
+                    if run_id in self.waiters and self.snapshots.get(run_id) != status:
+                        self.snapshots[run_id] = status
+                        changed = True
+                if changed:
+                    self.cond.notify_all()
 
 
+def _lifecycle(status):
+    """Position of status in a run's life: queued, running, cancelling, then a terminal state."""
+    if status in TERMINAL_STATES:
+        return len(run_store.ACTIVE_STATES)
+    return run_store.ACTIVE_STATES.index(status) if status in run_store.ACTIVE_STATES else -1
+
+
+notifier = StatusNotifier()
+executor = run_executor.RunExecutor()
+
+# Define the 'runs' namespace for endpoints
+runs_ns = api.namespace('runs', description='Operations related to runs')
+
 
 run_input_model = api.model('RunInput', {
     'runType': fields.String(required=True, enum=['CCAR', 'RiskApetite', 'Stress'], description="Type of the run"),
@@ -55,66 +143,168 @@ class Runs(Resource):
         cob_date = data.get('cobDate', '20240724')
         run_group = data.get('runGroup', 'default_group')
         run = Run(run_id, run_type, run_scenario, cob_date, run_group)
-        runs[run_id] = run
+        store.add(run)
         # Create the log file and add a starting log message
-        with open(run.log_file, 'w') as f:
-            f.write(f"Run {run_id} started at {time.ctime()}\n")
-            f.write(f"Run Type: {run.run_type}, Scenario: {run.run_scenario}, Cob Date: {run.cob_date}, Group: {run.run_group}\n")
-        run_logs[run_id] = run.log_file
-         # Run the dummy run in a thread
-        thread = threading.Thread(target=dummy_run, args=(run,))
-        thread.start()
+        run.log = log_files.RunLogWriter(run.log_file)
+        run.log.write(f"Run {run_id} started at {time.ctime()}\n")
+        run.log.write(f"Run Type: {run.run_type}, Scenario: {run.run_scenario}, Cob Date: {run.cob_date}, Group: {run.run_group}\n")
+        # Queue the dummy run for the next free slot
+        try:
+            executor.submit(run_id, dummy_run, run)
+        except run_executor.QueueFullError as e:
+            run.log.close(compress=False)
+            os.remove(run.log_file)
+            store.remove(run_id)
+            return {'message': 'Too many runs queued, retry later'}, 429, {'Retry-After': '5'}
         return {'runId': run_id}, 201
 
 @runs_ns.route('/<string:run_id>')
 class RunById(Resource):
-    @runs_ns.doc(params={'run_id': 'ID of the run'})
+    @runs_ns.doc(params={'run_id': 'ID of the run',
+                         'wait': 'Seconds to wait for the status to change before answering (long poll)'})
     def get(self, run_id):
         """Get the status of a run."""
-        if run_id not in runs:
+        run = store.get(run_id)
+        if run is None:
             return {'message': 'Run not found'}, 404
-        return {'status': runs[run_id].status}, 200
+        wait = request.args.get('wait', default=0, type=float)
+        status = run.status
+        if wait > 0 and status not in TERMINAL_STATES:
+            status = notifier.wait_for_change(run_id, status, min(wait, MAX_WAIT))
+        return {'status': status}, 200
 
     @runs_ns.doc(params={'run_id': 'ID of the run to kill'})
     def delete(self, run_id):
         """Kill a run."""
-        if run_id not in runs:
+        run = store.get(run_id)
+        if run is None:
            return {'message': 'Run not found'}, 404
-        runs[run_id].status = "killed"
-        with open(runs[run_id].log_file, 'a') as f:
-           f.write(f"Run {run_id} killed at {time.ctime()}\n")
+        if run.status == "cancelling":
+            return {'status': run.status}, 200
+        if not notifier.set_status(run, "cancelling"):
+            # Finished, or was already being cancelled, before this request got to it
+            if run.status in TERMINAL_STATES:
+                return {'message': f'Run already {run.status}', 'status': run.status}, 409
+            return {'status': run.status}, 200
+        if executor.cancel(run_id):
+            # Still queued, so no worker will pick it up
+            finish_run(run, "killed", f"Run {run_id} killed at {time.ctime()}\n")
+        # Otherwise the run thread (in this or another worker) notices the cancel, logs it and marks the run killed
+        return {'status': run.status}, 200
+
 
-        return '', 200
+@runs_ns.route('/<string:run_id>/events')
+class RunEvents(Resource):
+    @runs_ns.doc(params={'run_id': 'ID of the run'})
+    def get(self, run_id):
+        """Stream status changes of a run as Server-Sent Events."""
+        run = store.get(run_id)
+        if run is None:
+            return {'message': 'Run not found'}, 404
+
+        def generate():
+            status = run.status
+            yield f"event: status\ndata: {json.dumps({'runId': run_id, 'status': status})}\n\n"
+            while status not in TERMINAL_STATES:
+                current = notifier.wait_for_change(run_id, status, HEARTBEAT_INTERVAL)
+                if current == status:
+                    # Keeps proxies from closing an idle stream
+                    yield ": heartbeat\n\n"
+                    continue
+                status = current
+                yield f"event: status\ndata: {json.dumps({'runId': run_id, 'status': status})}\n\n"
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @runs_ns.route('/<string:run_id>/log')
 class RunLog(Resource):
-    @runs_ns.doc(params={'run_id': 'ID of the run'})
+    @runs_ns.doc(params={'run_id': 'ID of the run',
+                         'follow': 'Keep the response open and stream new lines until the run ends',
+                         'tail': 'Only return the last N lines',
+                         'offset': 'Byte offset to resume from'})
     def get(self, run_id):
-        """Get the log file for a run."""
-        if run_id not in runs:
+        """Get the log file for a run. Supports Range requests."""
+        run = store.get(run_id)
+        if run is None:
             return {'message': 'Run not found'}, 404
-        
-        log_file = runs[run_id].log_file
+
+        log_file = run.log_file
+        follow = request.args.get('follow', 'false').lower() in ('1', 'true', 'yes')
+        tail = request.args.get('tail', type=int)
+        offset = request.args.get('offset', default=0, type=int)
+
         if not os.path.exists(log_file):
-             return {'message': 'Log file not found'}, 404
-        
-        def generate():
-            with open(log_file, 'r') as f:
-                yield from f
-        return Response(generate(), mimetype='text/plain')
-
-
-def dummy_run(run):
-    """Simulates a dummy run, updating status and log."""
-    run.status = "running"
-    with open(run.log_file, 'a') as f:
-        f.write(f"Run {run.run_id} is running...\n")
-    time.sleep(10)
-    if run.status != "killed":
-        run.status = "completed"
-        with open(run.log_file, 'a') as f:
-            f.write(f"Run {run.run_id} completed at {time.ctime()}\n")
+            if not os.path.exists(log_files.archived_path(log_file)):
+                return {'message': 'Log file not found'}, 404
+            return self.get_archived(log_file, tail, offset)
+        size = os.path.getsize(log_file)
+        headers = {'Accept-Ranges': 'bytes'}
+
+        if tail is not None:
+            start = log_files.tail_offset(log_file, max(tail, 0))
+        else:
+            start = min(max(offset, 0), size)
+        if follow:
+            headers['X-Log-Offset'] = str(start)
+            body = log_files.follow(log_file, start, lambda: store.get_status(run_id) in TERMINAL_STATES)
+            return Response(stream_with_context(body), mimetype='text/plain', headers=headers)
+
+        status = 200
+        end = size
+        if request.range is not None:
+            byte_range = request.range.range_for_length(size)
+            if byte_range is None:
+                return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+            start, end = byte_range
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        headers['X-Log-Offset'] = str(start)
+        headers['Content-Length'] = str(end - start)
+        return Response(log_files.read_range(log_file, start, end), status=status, mimetype='text/plain',
+                        headers=headers)
+
+    def get_archived(self, log_file, tail, offset):
+        """Serve a finished run's compressed log."""
+        gz_file = log_files.archived_path(log_file)
+        if tail is None and not offset and request.range is None and 'gzip' in request.accept_encodings:
+            # Hand the archive over as-is and let the client decompress it
+            return Response(log_files.read_range(gz_file), mimetype='text/plain',
+                            headers={'Content-Encoding': 'gzip', 'Content-Length': str(os.path.getsize(gz_file))})
+        body = log_files.read_archived(log_file, start=max(offset, 0), tail=max(tail, 0) if tail is not None else None)
+        return Response(body, mimetype='text/plain')
+
+
+def dummy_run(run, cancel):
+    """Simulates a dummy run, updating status and log. Stops early when cancel is set."""
+    if cancel.is_set() or not notifier.set_status(run, "running"):
+        # Killed while queued, after the future could no longer be cancelled
+        finish_run(run, "killed", f"Run {run.run_id} killed at {time.ctime()}\n")
+        return
+    run.log.write(f"Run {run.run_id} is running...\n")
+    try:
+        # Sleeping on the event lets a local kill interrupt the work straight away;
+        # a kill sent to another worker is seen through the store
+        deadline = time.monotonic() + 10
+        killed = False
+        while not killed and time.monotonic() < deadline:
+            killed = (cancel.wait(min(STORE_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+                      or store.cancel_requested(run.run_id))
+        if killed:
+            finish_run(run, "killed", f"Run {run.run_id} killed at {time.ctime()}\n")
+        else:
+            finish_run(run, "completed", f"Run {run.run_id} completed at {time.ctime()}\n")
+    except Exception as e:
+        finish_run(run, "failed", f"Run {run.run_id} failed at {time.ctime()}: {e}\n")
+        raise
+
+
+def finish_run(run, status, message):
+    """Write the last log line, publish the terminal status and archive the log."""
+    run.log.write(message)
+    run.log.flush()
+    notifier.set_status(run, status)
+    run.log.close()
 
 
 if __name__ == '__main__':
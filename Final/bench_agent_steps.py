@@ -0,0 +1,94 @@
+"""Per-step overhead of the pulsar3 agent loop as the conversation grows.
+
+Run from Final/:  python bench_agent_steps.py [steps]
+
+A scripted model asks for one tool call per turn for the given number of
+steps, and the tool returns a fixed result at once, so what is measured is
+the graph itself: state merging, prompt building and checkpointing. Each
+row is the median time of one loop iteration (run_agent, parse,
+tools) around that step.
+"""
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+STEPS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+TOOL_OUTPUT = "x" * 400
+WINDOW = 5
+
+checkpoint_dir = tempfile.mkdtemp(prefix="bench_checkpoints_")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ["PULSAR_MAX_ITERATIONS"] = str(STEPS + 1)
+os.environ["PULSAR_MAX_SCRATCHPAD_TOKENS"] = str(10 ** 9)
+os.environ["CHECKPOINT_DB"] = os.path.join(checkpoint_dir, "checkpoints.db")
+
+from langchain_core.globals import set_llm_cache  # noqa: E402
+from langchain_core.language_models.chat_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatResult  # noqa: E402
+from langgraph.checkpoint.memory import InMemorySaver  # noqa: E402
+
+import checkpointing  # noqa: E402
+import pulsar3  # noqa: E402
+
+
+class ScriptedModel(BaseChatModel):
+    """Calls the echo tool until STEPS tool results are in the prompt, then answers."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        done = sum(1 for m in messages if m.type == "tool")
+        if done < STEPS:
+            message = AIMessage(content="", tool_calls=[{"name": "echo", "args": {"step": done}, "id": f"call_{done}"}])
+        else:
+            message = AIMessage(content="done")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+
+def iteration_times(graph, thread_id):
+    config = {"configurable": {"thread_id": thread_id}, "recursion_limit": pulsar3.RECURSION_LIMIT}
+    times = []
+    last = time.perf_counter()
+    for chunk in graph.stream({"input": "benchmark"}, config, stream_mode="updates"):
+        if "handle_tool_call" in chunk and chunk["handle_tool_call"]["call_tools"]:
+            now = time.perf_counter()
+            times.append((now - last) * 1000)
+            last = now
+    return times
+
+
+def main():
+    set_llm_cache(None)
+    pulsar3.llm = ScriptedModel()
+    pulsar3.tool_registry.select = lambda query, limit=None: ["echo"]
+    pulsar3.tool_registry.openai_tools = lambda names: []
+    pulsar3._run_tool = lambda action, config=None: TOOL_OUTPUT
+    savers = {
+        "none": None,
+        "memory": InMemorySaver(),
+        "sqlite": checkpointing.Checkpointer(sqlite3.connect(os.environ["CHECKPOINT_DB"], check_same_thread=False)),
+    }
+    try:
+        results = {name: iteration_times(pulsar3.build_graph(saver), name) for name, saver in savers.items()}
+        print(f"{STEPS} tool steps, {len(TOOL_OUTPUT)} chars per result; ms per iteration (median of {WINDOW})")
+        print(f"{'step':>6} " + " ".join(f"{name:>8}" for name in savers))
+        marks = sorted({1, 10, 25, 50, 100, 200, 500, STEPS} & set(range(1, STEPS + 1)))
+        for step in marks:
+            window = slice(max(0, step - WINDOW), step)
+            print(f"{step:>6} " + " ".join(f"{statistics.median(results[name][window]):>8.2f}" for name in savers))
+    finally:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Prompt size with every spec in the prompt vs only the top-k endpoints from EndpointIndex.
+
+Run from Final/:  python bench_prompt_tokens.py [max_copies]
+
+The specs in open_api_specs are cloned under new names to simulate a growing
+catalogue. Tokens are counted with tiktoken when its encoding is available,
+otherwise estimated as characters / 4.
+"""
+import copy
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import spec_cache
+from endpoint_index import EndpointIndex, TOP_K
+
+QUERIES = [
+    "show me stress results for CCAR 20240724 Base",
+    "what is the status of run 42",
+    "start a batch run for cob 20240724",
+    "cancel run 42",
+    "download the allowance results",
+]
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # not installed, or the encoding cannot be downloaded
+    _encoding = None
+
+
+def count_tokens(text):
+    return len(_encoding.encode(text)) if _encoding else len(text) // 4
+
+
+def scaled_specs(specs, copies):
+    """copies x the real specs, with paths and summaries renamed so every copy is distinct."""
+    scaled = dict(specs)
+    for n in range(1, copies):
+        for filename, spec in specs.items():
+            clone = copy.deepcopy(spec)
+            clone["paths"] = {f"/svc{n}{path}": {method: {**op, "summary": f"{op.get('summary', '')} (service {n})"}
+                                                 if isinstance(op, dict) else op
+                                                 for method, op in item.items()}
+                              for path, item in spec.get("paths", {}).items()}
+            scaled[f"{filename.rsplit('.', 1)[0]}_{n}.yaml"] = clone
+    return scaled
+
+
+def main():
+    max_copies = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    specs = spec_cache.load_specs("open_api_specs")
+    index_dir = tempfile.mkdtemp(prefix="endpoint_index_")
+    print(f"token counts: {'tiktoken cl100k_base' if _encoding else 'estimated (chars / 4)'}")
+    print(f"{'specs':>6} {'endpoints':>9} {'full tokens':>11} {'top-k tokens':>12} "
+          f"{'build ms':>9} {'load ms':>8} {'search p50 ms':>13}")
+    try:
+        copies = 1
+        while copies <= max_copies:
+            catalogue = scaled_specs(specs, copies)
+            # What pulsar2 used to put in the prompt on every turn
+            full_tokens = count_tokens(str(catalogue))
+
+            start = time.perf_counter()
+            index = EndpointIndex(catalogue, index_dir=index_dir)
+            build_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            index = EndpointIndex(catalogue, index_dir=index_dir)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            timings, topk_tokens = [], []
+            for query in QUERIES:
+                start = time.perf_counter()
+                context = index.prompt_context(query, TOP_K)
+                timings.append((time.perf_counter() - start) * 1000)
+                topk_tokens.append(count_tokens(context))
+            print(f"{len(catalogue):>6} {len(index.endpoints):>9} {full_tokens:>11} "
+                  f"{max(topk_tokens):>12} {build_ms:>9.1f} {load_ms:>8.1f} {statistics.median(timings):>13.2f}")
+            copies *= 2
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+from typing import Annotated
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import InjectedToolCallId, StructuredTool
+from langgraph.checkpoint.sqlite import SqliteSaver
+from pydantic import create_model
+
+# Durable LangGraph state for the agents.
+# Graphs compiled with get_checkpointer() save a checkpoint after every node to
+# CHECKPOINT_DB, keyed by the thread_id in the run config, so an interrupted run
+# continues from the last completed node instead of repeating its LLM and tool
+# calls. Tool results are also stored per (thread, tool call id): a node that
+# is re-run after a crash gets the results of the calls that already finished.
+# Only the newest KEEP_CHECKPOINTS checkpoints of a thread and the MAX_THREADS
+# most recently written threads are kept.
+
+CHECKPOINT_DB = os.getenv('CHECKPOINT_DB', 'checkpoints.db')
+KEEP_CHECKPOINTS = int(os.getenv('CHECKPOINT_KEEP', 10))
+MAX_THREADS = int(os.getenv('CHECKPOINT_MAX_THREADS', 500))
+COMPACT_EVERY = 20  # checkpoints written between compactions
+
+
+class Checkpointer(SqliteSaver):
+    def __init__(self, conn, keep=KEEP_CHECKPOINTS, max_threads=MAX_THREADS, **kwargs):
+        super().__init__(conn, **kwargs)
+        self.keep = keep
+        self.max_threads = max_threads
+        self.writes_since_compact = 0
+
+    def setup(self):
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS tool_results (
+                thread_id TEXT NOT NULL,
+                call_id TEXT NOT NULL,
+                tool TEXT,
+                output TEXT,
+                PRIMARY KEY (thread_id, call_id)
+            )""")
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        self.writes_since_compact += 1
+        if self.writes_since_compact >= COMPACT_EVERY:
+            self.writes_since_compact = 0
+            self.compact()
+        return saved
+
+    def compact(self):
+        """Drop all but the newest checkpoints of every thread, and the least recently written threads."""
+        with self.cursor() as cur:
+            cur.execute("""
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS age
+                        FROM checkpoints)
+                    WHERE age > ?)""", (self.keep,))
+            cur.execute("""
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints c WHERE c.thread_id = writes.thread_id
+                    AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id)""")
+            cur.execute("""
+                SELECT thread_id FROM checkpoints GROUP BY thread_id
+                ORDER BY MAX(rowid) DESC LIMIT -1 OFFSET ?""", (self.max_threads,))
+            stale = [(row[0],) for row in cur.fetchall()]
+            for table in ('checkpoints', 'writes', 'tool_results'):
+                cur.executemany(f"DELETE FROM {table} WHERE thread_id = ?", stale)
+
+    def delete_thread(self, thread_id):
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM tool_results WHERE thread_id = ?", (str(thread_id),))
+
+    def tool_result(self, thread_id, call_id):
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT output FROM tool_results WHERE thread_id = ? AND call_id = ?",
+                        (str(thread_id), call_id))
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    def save_tool_result(self, thread_id, call_id, tool, output):
+        with self.cursor() as cur:
+            cur.execute("INSERT OR REPLACE INTO tool_results (thread_id, call_id, tool, output) VALUES (?, ?, ?, ?)",
+                        (str(thread_id), call_id, tool, output))
+
+    def run_tool(self, config, call_id, tool, func):
+        """func(), or the output it returned when this tool call already completed in this thread.
+
+        Outputs are only stored when func returns; a call that raised runs again next time.
+        """
+        thread_id = ((config or {}).get('configurable') or {}).get('thread_id')
+        if thread_id is None or not call_id:
+            return func()
+        output = self.tool_result(thread_id, call_id)
+        if output is None:
+            output = str(func())
+            self.save_tool_result(thread_id, call_id, tool, output)
+        return output
+
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer():
+    """The process-wide Checkpointer on CHECKPOINT_DB, shared by every compiled graph."""
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            _checkpointer = Checkpointer(sqlite3.connect(CHECKPOINT_DB, check_same_thread=False))
+        return _checkpointer
+
+
+def memoized_tool(tool, checkpointer=None):
+    """Copy of tool for prebuilt agents (ToolNode) whose results are stored per thread and tool call id."""
+    checkpointer = checkpointer or get_checkpointer()
+    schema = create_model(tool.args_schema.__name__, __base__=tool.args_schema,
+                          tool_call_id=(Annotated[str, InjectedToolCallId], ...))
+
+    def run(config: RunnableConfig, tool_call_id: str, **kwargs):
+        return checkpointer.run_tool(config, tool_call_id, tool.name, lambda: tool.invoke(kwargs, config))
+
+    return StructuredTool.from_function(func=run, name=tool.name, description=tool.description, args_schema=schema)
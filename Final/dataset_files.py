@@ -0,0 +1,116 @@
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import threading
+
+try:
+    import zstandard
+except ImportError:  # zstd variants are optional
+    zstandard = None
+
+# Validators and pre-compressed copies of the downloadable datasets.
+# The content hash behind the ETag is computed once per (mtime, size), and
+# compressed variants are written to VARIANTS_DIR_NAME next to the datasets,
+# named after that hash so a changed dataset never serves an old variant.
+# Variants are built in the background; until one is ready the file is sent as is.
+
+VARIANTS_DIR_NAME = '.variants'
+PRECOMPRESS = os.getenv('DOWNLOAD_PRECOMPRESS', '1') == '1'
+MIN_SAVING = 0.1  # xlsx is already zipped; only keep a variant that is at least this much smaller
+CHUNK_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def _gzip(src, dst):
+    with open(src, 'rb') as f_in, gzip.GzipFile(dst, 'wb', compresslevel=9, mtime=0) as f_out:
+        shutil.copyfileobj(f_in, f_out, CHUNK_SIZE)
+
+
+def _zstd(src, dst):
+    with open(src, 'rb') as f_in, open(dst, 'wb') as f_out:
+        zstandard.ZstdCompressor(level=19).copy_stream(f_in, f_out)
+
+
+ENCODINGS = {'zstd': ('.zst', _zstd), 'gzip': ('.gz', _gzip)}
+if zstandard is None:
+    del ENCODINGS['zstd']
+
+
+class DatasetFiles:
+    def __init__(self, datasets_dir):
+        self.variants_dir = os.path.join(datasets_dir, VARIANTS_DIR_NAME)
+        self.digests = {}  # path -> ((mtime_ns, size), sha256)
+        self.variants = {}  # (path, digest, encoding) -> variant path, or None if not worth keeping
+        self.building = set()
+        self.lock = threading.Lock()
+
+    def info(self, path):
+        """(etag, mtime) for path. The ETag is strong: it changes whenever the content or mtime does."""
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            entry = self.digests.get(path)
+        if entry is None or entry[0] != key:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    sha.update(chunk)
+            entry = (key, sha.hexdigest())
+            with self.lock:
+                self.digests[path] = entry
+        return f'{entry[1][:32]}-{key[0]:x}', stat.st_mtime
+
+    def variant(self, path, etag, accept_encoding):
+        """(encoding, variant path) of the best ready pre-compressed copy the client accepts, or (None, path)."""
+        if not PRECOMPRESS:
+            return None, path
+        accepted = {part.split(';')[0].strip().lower() for part in (accept_encoding or '').split(',')}
+        for encoding, (suffix, _) in ENCODINGS.items():
+            if encoding not in accepted:
+                continue
+            key = (path, etag, encoding)
+            with self.lock:
+                if key in self.variants:
+                    variant_path = self.variants[key]
+                    if variant_path is not None:
+                        return encoding, variant_path
+                    continue
+                variant_path = self._variant_path(path, etag, suffix)
+                if os.path.exists(variant_path):
+                    self.variants[key] = variant_path
+                    return encoding, variant_path
+                if key not in self.building:
+                    self.building.add(key)
+                    threading.Thread(target=self._build, args=(path, etag, encoding), daemon=True).start()
+        return None, path
+
+    def _variant_path(self, path, etag, suffix):
+        return os.path.join(self.variants_dir, f'{os.path.basename(path)}.{etag}{suffix}')
+
+    def _build(self, path, etag, encoding):
+        suffix, compress = ENCODINGS[encoding]
+        variant_path = self._variant_path(path, etag, suffix)
+        result = None
+        try:
+            os.makedirs(self.variants_dir, exist_ok=True)
+            tmp_path = f'{variant_path}.{os.getpid()}.tmp'
+            compress(path, tmp_path)
+            if os.path.getsize(tmp_path) <= os.path.getsize(path) * (1 - MIN_SAVING):
+                os.replace(tmp_path, variant_path)
+                result = variant_path
+            else:
+                os.remove(tmp_path)
+            # Variants of older versions of this dataset are never served again
+            pattern = os.path.join(self.variants_dir, f'{glob.escape(os.path.basename(path))}.*{suffix}')
+            for stale in glob.glob(pattern):
+                if stale != variant_path:
+                    os.remove(stale)
+        except OSError as e:
+            logger.warning(f'Could not build {encoding} variant of {path}: {e}')
+        with self.lock:
+            self.variants[(path, etag, encoding)] = result
+            self.building.discard((path, etag, encoding))
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import logging
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+from spec_cache import CACHE_DIR
+from tool_registry import Endpoint, iter_endpoints, tokenize
+
+# Vector index over the endpoints of the loaded OpenAPI specs.
+# Each endpoint is embedded once from its summary, parameters and schemas and the
+# vectors are stored in CACHE_DIR, keyed by the endpoint documents and the embedder,
+# so restarts only re-embed when a spec or the embedder changes. The agents use it
+# to put only the top-k endpoints for a question in front of the model.
+
+TOP_K = int(os.getenv('ENDPOINT_TOP_K', 5))
+EMBEDDING_MODEL = os.getenv('ENDPOINT_EMBEDDING_MODEL')  # local sentence-transformers model; unset = hashing
+HASHING_DIM = int(os.getenv('ENDPOINT_HASHING_DIM', 512))
+
+logger = logging.getLogger(__name__)
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embedder: no model download, same vectors on every machine."""
+
+    def __init__(self, dim=HASHING_DIM):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def features(self, text):
+        # Crude plural folding so "results" and "result" land in the same bucket
+        words = [w[:-1] if len(w) > 3 and w.endswith('s') else w for w in tokenize(text)]
+        return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+    def embed_query(self, text):
+        vector = [0.0] * self.dim
+        for feature in self.features(text):
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], 'little') % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def get_embedder():
+    """The configured local embedder, falling back to HashingEmbedder when it cannot be loaded."""
+    if EMBEDDING_MODEL:
+        try:
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+            embedder = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+            embedder.name = f'hf-{EMBEDDING_MODEL}'
+            return embedder
+        except Exception as e:
+            logger.warning(f"Could not load embedding model {EMBEDDING_MODEL}, using hashing embedder: {e}")
+    return HashingEmbedder()
+
+
+def _resolve(spec, node, depth=0):
+    if isinstance(node, dict) and '$ref' in node and depth < 5:
+        target = spec
+        for part in node['$ref'].lstrip('#/').split('/'):
+            target = target.get(part, {}) if isinstance(target, dict) else {}
+        return _resolve(spec, target, depth + 1)
+    return node
+
+
+def _schema_words(spec, schema, depth=0):
+    schema = _resolve(spec, schema)
+    if not isinstance(schema, dict) or depth > 3:
+        return []
+    words = [schema.get('description', '')]
+    for name, prop in (schema.get('properties') or {}).items():
+        words.append(name)
+        words.extend(_schema_words(spec, prop, depth + 1))
+    if 'items' in schema:
+        words.extend(_schema_words(spec, schema['items'], depth + 1))
+    return words
+
+
+def endpoint_document(endpoint: Endpoint, spec: Dict) -> str:
+    """Text embedded for an endpoint: what it does, what it takes and what it returns."""
+    operation = endpoint.operation
+    words = [endpoint.text()]
+    for param in operation.get('parameters', []):
+        param = _resolve(spec, param)
+        if isinstance(param, dict):
+            words.append(f"{param.get('name', '')} {param.get('description', '')}")
+    for media in ((_resolve(spec, operation.get('requestBody')) or {}).get('content') or {}).values():
+        words.extend(_schema_words(spec, media.get('schema')))
+    for response in (operation.get('responses') or {}).values():
+        response = _resolve(spec, response) or {}
+        words.append(response.get('description', ''))
+        for media in (response.get('content') or {}).values():
+            words.extend(_schema_words(spec, media.get('schema')))
+    return ' '.join(w for w in words if w)
+
+
+def describe(endpoint: Endpoint) -> str:
+    """One-line summary of an endpoint for a prompt."""
+    params = []
+    for param in endpoint.operation.get('parameters', []):
+        if isinstance(param, dict) and 'name' in param:
+            required = ', required' if param.get('required') else ''
+            params.append(f"{param['name']} ({param.get('in', 'query')}{required}): {param.get('description', '')}".rstrip(': '))
+    line = f"{endpoint.method.upper()} {endpoint.base_url}{endpoint.path} - {endpoint.summary}"
+    if endpoint.operation.get('requestBody'):
+        line += ' [JSON body]'
+    if params:
+        line += '; params: ' + '; '.join(params)
+    return line
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class EndpointIndex:
+    def __init__(self, specs: Dict[str, Dict], embedder=None, index_dir=CACHE_DIR):
+        self.embedder = embedder or get_embedder()
+        self.endpoints: List[Endpoint] = list(iter_endpoints(specs))
+        self.by_name = {endpoint.name: endpoint for endpoint in self.endpoints}
+        documents = [endpoint_document(endpoint, specs[endpoint.spec_name]) for endpoint in self.endpoints]
+        embedder_name = getattr(self.embedder, 'name', type(self.embedder).__name__)
+        key = hashlib.sha256(json.dumps([embedder_name, [e.name for e in self.endpoints], documents]).encode()).hexdigest()
+        self.path = os.path.join(index_dir, f'endpoints-{key}.json')
+        self.vectors = self._load() or self._build(documents, embedder_name)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if stored.get('names') != [endpoint.name for endpoint in self.endpoints]:
+            return None
+        return stored['vectors']
+
+    def _build(self, documents, embedder_name):
+        vectors = [_normalize(v) for v in self.embedder.embed_documents(documents)] if documents else []
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'embedder': embedder_name, 'names': [e.name for e in self.endpoints],
+                           'vectors': [[round(x, 6) for x in v] for v in vectors]}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write endpoint index {self.path}: {e}")
+        return vectors
+
+    def search(self, query: str, k: Optional[int] = TOP_K) -> List[Tuple[Endpoint, float]]:
+        """Endpoints most similar to query, best first. Endpoints with no similarity are left out."""
+        q = _normalize(self.embedder.embed_query(query))
+        scored = []
+        for i, vector in enumerate(self.vectors):
+            score = sum(a * b for a, b in zip(q, vector))
+            if score > 0:
+                scored.append((-score, i))
+        scored.sort()
+        return [(self.endpoints[i], -score) for score, i in scored[:k]]
+
+    def ranker(self, query: str, endpoints: List[Endpoint]) -> List[str]:
+        """ToolRegistry ranker backed by this index."""
+        allowed = {endpoint.name for endpoint in endpoints}
+        return [endpoint.name for endpoint, _ in self.search(query, k=None) if endpoint.name in allowed]
+
+    def prompt_context(self, query: str, k: Optional[int] = TOP_K) -> str:
+        """The top-k endpoints for query, one line each; all endpoints if none match."""
+        matches = [endpoint for endpoint, _ in self.search(query, k)] or self.endpoints[:k]
+        return '\n'.join(describe(endpoint) for endpoint in matches)
+
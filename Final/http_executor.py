@@ -0,0 +1,188 @@
+import asyncio
+import atexit
+import logging
+import os
+import random
+import threading
+from typing import Dict, Optional
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+# HTTP layer for the API tools.
+# One keep-alive httpx.AsyncClient per origin (the spec's servers), a semaphore
+# per origin so one slow service cannot take every slot, and a single event loop
+# thread so sync callers (LangChain Tool.func) and async callers (Tool.coroutine)
+# share the same pools. The clients and semaphores belong to that loop, so
+# callers on other threads or loops go through request() or aexecute().
+
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 30))
+MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', 10))
+HOST_CONCURRENCY = int(os.getenv('HTTP_HOST_CONCURRENCY', 8))
+RETRIES = int(os.getenv('HTTP_RETRIES', 3))
+BACKOFF = float(os.getenv('HTTP_BACKOFF', 0.5))
+MAX_BACKOFF = float(os.getenv('HTTP_MAX_BACKOFF', 10))
+MAX_RESPONSE_BYTES = int(os.getenv('HTTP_MAX_RESPONSE_BYTES', 256 * 1024))
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+logger = logging.getLogger(__name__)
+
+
+def origin(url):
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+class HttpExecutor:
+    """Pooled, rate-limited HTTP requests usable from sync and async code."""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None, retries=RETRIES,
+                 host_concurrency=HOST_CONCURRENCY, max_response_bytes=MAX_RESPONSE_BYTES):
+        self.transport = transport  # tests can pass httpx.MockTransport or an ASGITransport stand-in
+        self.retries = retries
+        self.host_concurrency = host_concurrency
+        self.max_response_bytes = max_response_bytes
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.loop = None
+        self.lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name='http-executor', daemon=True).start()
+        return self.loop
+
+    def _client(self, key):
+        # Only touched from the event loop thread
+        client = self.clients.get(key)
+        if client is None:
+            client = self.clients[key] = httpx.AsyncClient(
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+                transport=self.transport,
+                follow_redirects=True,  # flask_restx redirects /runs to /runs/
+            )
+            self.semaphores[key] = asyncio.Semaphore(self.host_concurrency)
+        return client, self.semaphores[key]
+
+    async def arequest(self, method, url, params=None, json=None, headers=None):
+        """Send a request and return the response body as text, capped at max_response_bytes.
+
+        Must run on the executor's own loop; use request() or aexecute() from anywhere else.
+        """
+        method = method.upper()
+        client, semaphore = self._client(origin(url))
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    async with client.stream(method, url, params=params, json=json, headers=headers) as response:
+                        if response.status_code in RETRY_STATUSES and self._retryable(method, response.status_code, attempt):
+                            delay = self._delay(attempt, response.headers.get('Retry-After'))
+                        else:
+                            return await self._read(response)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # Nothing reached the server, so any method can be retried
+                if attempt >= self.retries:
+                    return f'Error: could not connect to {origin(url)}: {e}'
+                delay = self._delay(attempt)
+            except httpx.TimeoutException as e:
+                if method not in IDEMPOTENT_METHODS or attempt >= self.retries:
+                    return f'Error: {method} {url} timed out: {e!r}'
+                delay = self._delay(attempt)
+            except httpx.HTTPError as e:
+                return f'Error: {method} {url} failed: {e}'
+            attempt += 1
+            logger.info(f'Retrying {method} {url} in {delay:.2f}s (attempt {attempt}/{self.retries})')
+            await asyncio.sleep(delay)
+
+    def request(self, method, url, params=None, json=None, headers=None, timeout=None):
+        """Blocking wrapper around arequest; safe to call from any thread except the executor's own."""
+        return self._submit(method, url, params, json, headers).result(timeout)
+
+    async def aexecute(self, method, url, params=None, json=None, headers=None):
+        """arequest for coroutines running on any other event loop, e.g. an agent's."""
+        return await asyncio.wrap_future(self._submit(method, url, params, json, headers))
+
+    def _submit(self, method, url, params, json, headers):
+        return asyncio.run_coroutine_threadsafe(self._execute(method, url, params, json, headers),
+                                                self._ensure_loop())
+
+    async def _execute(self, method, url, params, json, headers):
+        # Tools report failures as text the model can read instead of raising into the agent
+        try:
+            return await self.arequest(method, url, params=params, json=json, headers=headers)
+        except Exception as e:
+            return f'Error: {method.upper()} {url} failed: {e!r}'
+
+    def _retryable(self, method, status, attempt):
+        if attempt >= self.retries:
+            return False
+        # A 5xx on a POST may already have created the run; only 429 is known to be safe to resend
+        return status == 429 or method in IDEMPOTENT_METHODS
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), MAX_BACKOFF)
+            except ValueError:
+                pass
+        return min(BACKOFF * 2 ** attempt, MAX_BACKOFF) * random.uniform(0.5, 1.0)
+
+    async def _read(self, response):
+        body = bytearray()
+        truncated = False
+        async for chunk in response.aiter_bytes():
+            body.extend(chunk)
+            if len(body) > self.max_response_bytes:
+                truncated = True
+                break
+        text = bytes(body[:self.max_response_bytes]).decode(response.encoding or 'utf-8', errors='replace')
+        if truncated:
+            text += f'\n... [truncated at {self.max_response_bytes} bytes]'
+        if response.is_error:
+            return f'HTTP {response.status_code}: {text}'
+        return text
+
+    def close(self):
+        with self.lock:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+
+        async def _close():
+            for client in list(self.clients.values()):
+                await client.aclose()
+            self.clients.clear()
+            self.semaphores.clear()
+
+        try:
+            asyncio.run_coroutine_threadsafe(_close(), loop).result(5)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+
+
+def resolve_url(base_url, path_or_url):
+    """Absolute URL for a tool input that may be a full URL or a path relative to the spec's server."""
+    if urlsplit(path_or_url).scheme:
+        return path_or_url
+    return urljoin(base_url.rstrip('/') + '/', path_or_url.lstrip('/'))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The process-wide HttpExecutor."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = HttpExecutor()
+            atexit.register(_executor.close)
+        return _executor
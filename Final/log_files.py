@@ -0,0 +1,184 @@
+import collections
+import glob
+import gzip
+import logging
+import os
+import shutil
+import threading
+import time
+import weakref
+
+# Run log writing, archiving and serving without re-reading logs from the start
+
+CHUNK_SIZE = 64 * 1024
+FOLLOW_POLL_INTERVAL = 0.5
+FLUSH_BYTES = int(os.getenv('RUN_LOG_FLUSH_BYTES', 8 * 1024))
+FLUSH_INTERVAL = float(os.getenv('RUN_LOG_FLUSH_INTERVAL', 1.0))
+COMPRESS_CLOSED = os.getenv('RUN_LOG_COMPRESS', 'true').lower() in ('1', 'true', 'yes')
+ARCHIVE_KEEP = int(os.getenv('RUN_LOG_ARCHIVE_KEEP', 1000))
+
+logger = logging.getLogger(__name__)
+
+
+class RunLogWriter:
+    """Keeps one buffered handle open for a run's log.
+
+    Writes from any thread go through a lock. Data reaches the file once
+    FLUSH_BYTES are buffered, after FLUSH_INTERVAL (via the shared flusher
+    thread) or on close, which also archives the log as <log>.gz.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'w', buffering=FLUSH_BYTES * 2)
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+        self.closed = False
+        _open_writers.add(self)
+        _ensure_flusher()
+
+    def write(self, text):
+        with self.lock:
+            if self.closed:
+                logger.warning(f'Dropping write to closed log {self.path}: {text.rstrip()}')
+                return
+            self.file.write(text)
+            self.unflushed += len(text)
+            if self.unflushed >= FLUSH_BYTES:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.closed and self.unflushed:
+                self._flush()
+
+    def _flush(self):
+        self.file.flush()
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def close(self, compress=COMPRESS_CLOSED):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.file.close()
+        _open_writers.discard(self)
+        if compress:
+            archive(self.path)
+
+
+_open_writers = weakref.WeakSet()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def _ensure_flusher():
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name='run-log-flusher', daemon=True)
+            _flusher.start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        now = time.monotonic()
+        for writer in list(_open_writers):
+            if writer.unflushed and now - writer.last_flush >= FLUSH_INTERVAL:
+                writer.flush()
+
+
+def archived_path(path):
+    return path + '.gz'
+
+
+def archive(path):
+    """Compress a closed log next to itself and prune the oldest archives beyond ARCHIVE_KEEP."""
+    try:
+        with open(path, 'rb') as src, gzip.open(archived_path(path) + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(archived_path(path) + '.tmp', archived_path(path))
+        os.remove(path)
+    except OSError as e:
+        logger.error(f'Failed to archive {path}: {e}')
+        return
+    archives = glob.glob(os.path.join(os.path.dirname(path) or '.', 'run_*.log.gz'))
+    if len(archives) > ARCHIVE_KEEP:
+        archives.sort(key=os.path.getmtime)
+        for old in archives[:len(archives) - ARCHIVE_KEEP]:
+            os.remove(old)
+
+
+def read_archived(path, start=0, tail=None):
+    """Yield a decompressed archive from byte start, or only its last `tail` lines."""
+    with gzip.open(archived_path(path), 'rb') as f:
+        if tail is not None:
+            lines = collections.deque(f, maxlen=tail) if tail else []
+            yield b''.join(lines)
+            return
+        f.seek(start)
+        yield from iter(lambda: f.read(CHUNK_SIZE), b'')
+
+
+def tail_offset(path, lines):
+    """Byte offset where the last `lines` lines of the file start, found by reading backwards."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        if lines <= 0:
+            return pos
+        # A trailing newline ends the last line rather than starting an empty one
+        newlines = -1
+        if pos:
+            f.seek(pos - 1)
+            if f.read(1) != b'\n':
+                newlines = 0
+        while pos > 0:
+            size = min(CHUNK_SIZE, pos)
+            pos -= size
+            f.seek(pos)
+            block = f.read(size)
+            for i in range(len(block) - 1, -1, -1):
+                if block[i] == 0x0A:
+                    newlines += 1
+                    if newlines == lines:
+                        return pos + i + 1
+        return 0
+
+
+def read_range(path, start=0, end=None):
+    """Yield the bytes of path in [start, end)."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def follow(path, start, is_finished, poll_interval=FOLLOW_POLL_INTERVAL):
+    """Yield data from start onwards, then whatever is appended until is_finished() is true.
+
+    The file is only read when its size has grown, so an idle follower costs one stat per poll.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while True:
+            # Checked before reading so lines written just before the run finished are still sent
+            finished = is_finished()
+            if os.fstat(f.fileno()).st_size > f.tell():
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+            if finished:
+                return
+            time.sleep(poll_interval)
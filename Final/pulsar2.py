@@ -1,5 +1,7 @@
 import os
-import yaml
+import spec_cache
+from endpoint_index import EndpointIndex
+from response_cache import LLMCache, get_cache as get_response_cache
 from dotenv import load_dotenv
 import gradio as gr
 from langchain.agents import AgentExecutor, create_react_agent
@@ -8,11 +10,13 @@ from langchain_community.utilities.openapi import OpenAPISpec
 from langchain_openai import ChatOpenAI
 from langchain_experimental.tools.python.tool import PythonREPLTool
 from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
+from session_memory import SessionMemories
 from langchain.callbacks import StdOutCallbackHandler
+from langchain_core.globals import set_llm_cache
 import logging
 
 LOG_FILE = "agent.log"
+TOOL_PREVIEW_CHARS = 300
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -23,18 +27,8 @@ logging.basicConfig(
 )
 
 def load_yaml_specs(folder_path):
-    """Loads all YAML files from a folder."""
-    specs = {}
-    for filename in os.listdir(folder_path):
-        if filename.endswith((".yaml", ".yml")):
-            file_path = os.path.join(folder_path, filename)
-            try:
-                with open(file_path, 'r') as f:
-                    spec = yaml.safe_load(f)
-                    specs[filename] = spec
-            except Exception as e:
-                print(f"Error loading {filename}: {e}")
-    return specs
+    """Loads all YAML files from a folder, reusing parsed specs that have not changed."""
+    return spec_cache.get_cache().load_folder(folder_path, extensions=(".yaml", ".yml"))
 
 python_repl = PythonREPLTool()
 
@@ -51,26 +45,48 @@ def create_agent_with_specs(specs, llm):
     tools.append(python_repl)
     # Updated prompt to include a summary of available specs and explicitly tell the agent to use the tools
     template = """
-    You read openAPI specifications from {specs}.
+    You read these openAPI endpoints: {specs}.
+    Conversation so far: {chat_history}
     Based on user's Query: {input} you generate python code to hit correct API endpoint. 
     You can execute code, use available tools {tool_names} and API is accessible {tools} {agent_scratchpad} 
     You present response to the user in a readable format.
     """
     prompt = PromptTemplate(template=template,
-                            input_variables=["specs","input","tool_names","tools","agent_scratchpad"])
+                            input_variables=["specs","chat_history","input","tool_names","tools","agent_scratchpad"])
     agent = create_react_agent(llm, tools, prompt)
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-    agent_executor = AgentExecutor(agent=agent, tools=tools, memory=memory, verbose=True, handle_parsing_errors=True, callbacks=[StdOutCallbackHandler()]) # Added verbose=True for debugging
+    # Memory is per chat session, see with_session_memory
+    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True, callbacks=[StdOutCallbackHandler()]) # Added verbose=True for debugging
     return agent_executor
 
-def agent_chat(message, history, agent_executor, specs):
-    """Handles chat input and returns the agent's response."""
+def with_session_memory(agent_executor, memory):
+    """Shallow copy of the shared agent_executor that reads and writes one session's memory."""
+    return agent_executor.model_copy(update={"memory": memory})
+
+async def agent_chat(message, history, agent_executor, endpoint_index):
+    """Handles chat input and yields the agent's response as it is produced."""
+    events = []
+    draft = ""
     try:
-        response = agent_executor.invoke({"input": message, "specs": specs, "tools": agent_executor.tools, "tool_names": [tool.name for tool in agent_executor.tools]})
-        # response = agent_executor.invoke({"input": message})
-        return response["output"]
+        # Only the endpoints relevant to this message go into the prompt, not every spec
+        specs = endpoint_index.prompt_context(message)
+        inputs = {"input": message, "specs": specs, "tools": agent_executor.tools, "tool_names": [tool.name for tool in agent_executor.tools]}
+        async for event in agent_executor.astream_events(inputs, version="v2"):
+            kind = event["event"]
+            if kind == "on_chat_model_stream":
+                draft += event["data"]["chunk"].content
+            elif kind == "on_tool_start":
+                events.append(f"> calling {event['name']}")
+                draft = ""
+            elif kind == "on_tool_end":
+                events.append(f"> {event['name']}: {str(event['data'].get('output')).strip()[:TOOL_PREVIEW_CHARS]}")
+            elif kind == "on_chain_end" and event["name"] == "AgentExecutor":
+                # The final answer replaces the streamed Thought/Action text
+                draft = event["data"]["output"]["output"]
+            else:
+                continue
+            yield "\n\n".join(events + [draft]).strip()
     except Exception as e:
-       return f"An error occurred: {e}"
+       yield f"An error occurred: {e}"
 
 def main():
     """Main function to run the Gradio interface."""
@@ -86,11 +102,25 @@ def main():
     print(f"Loaded OpenAPI specs: {spec_names}")
 
 
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+    set_llm_cache(LLMCache(get_response_cache()))
+    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, streaming=True)
     agent_executor = create_agent_with_specs(specs, llm)
+    endpoint_index = EndpointIndex(specs)
+    # Summaries are not shown to the user, so they use a non-streaming model
+    summary_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+    memories = SessionMemories(summary_llm, memory_key="chat_history", input_key="input", output_key="output")
+
+    async def chat(message, history, request: gr.Request):
+        session_id = request.session_hash if request is not None else "default"
+        memory = memories.get(session_id)
+        # The agent loads memory through the sync path; let the last turn's summary finish without blocking the loop
+        await memory.await_summary()
+        session_executor = with_session_memory(agent_executor, memory)
+        async for partial in agent_chat(message, history, session_executor, endpoint_index):
+            yield partial
 
     iface = gr.ChatInterface(
-        fn=lambda message, history: agent_chat(message, history, agent_executor, specs),
+        fn=chat,
         title="Pulsar",
         description="Ask a question related to APIs.",
         type="messages"
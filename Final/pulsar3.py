@@ -1,11 +1,14 @@
 import os
-import yaml
+import spec_cache
+from checkpointing import get_checkpointer
+from endpoint_index import EndpointIndex
+from http_executor import HttpExecutor, get_executor, resolve_url
+from response_cache import HTTP_TTL, LLMCache, ResponseCache, cacheable, get_cache as get_response_cache, http_key
+from tool_registry import ToolRegistry
 from dotenv import load_dotenv
 from langchain.tools import Tool
-from langchain_core.utils.function_calling import convert_to_openai_tool
-from langchain_community.utilities.openapi import OpenAPISpec
-from langchain_community.utilities import TextRequestsWrapper
-from typing import List, Dict, TypedDict, Annotated
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, TypedDict, Annotated, Union
 from langchain_experimental.tools import PythonREPLTool
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
@@ -13,198 +16,276 @@ from langchain.agents import Tool
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.agents.format_scratchpad.openai_tools import format_to_openai_tool_messages
 from langchain.agents.output_parsers.openai_tools import OpenAIToolsAgentOutputParser
+from langchain.agents.output_parsers.tools import ToolAgentAction
+from langchain_core.agents import AgentFinish
+from langchain_core.globals import set_llm_cache
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
 # from langchain.schema.runnable import RunnablePassthrough
 import gradio as gr
 import json
 import operator
 
 class State(TypedDict):
+    # Annotated keys are merged with operator.add: nodes return only the new items, never the whole list
     messages: Annotated[List[Dict], operator.add]
     input: str
-    intermediate_steps: Annotated[List[Dict], operator.add]
+    # Tool calls and their results as chat messages, converted once when the tools return
+    scratchpad: Annotated[List[BaseMessage], operator.add]
+    scratchpad_tokens: Annotated[int, operator.add]
+    iterations: Annotated[int, operator.add]
+    active_tools: List[str]
+    response: BaseMessage
+    action: Union[List[ToolAgentAction], AgentFinish]
+    tool_outputs: List[str]
+    call_tools: bool
 
 
 load_dotenv(override=True)
 openai_api_key = os.getenv('OPENAI_API_KEY')
+TOOL_FANOUT = int(os.getenv('PULSAR_TOOL_FANOUT', 8))
+TOOL_PREVIEW_CHARS = 300
+# Per question: model calls, and estimated tokens of tool calls and results in the prompt.
+# Past either limit the model has to answer with what it has.
+MAX_ITERATIONS = int(os.getenv('PULSAR_MAX_ITERATIONS', 10))
+MAX_SCRATCHPAD_TOKENS = int(os.getenv('PULSAR_MAX_SCRATCHPAD_TOKENS', 16000))
+BUDGET_NOTE = "The tool budget for this question is used up. Answer now from the tool results above."
+# Graph steps per question: three nodes per model call, plus the final answer
+RECURSION_LIMIT = 3 * (MAX_ITERATIONS + 1) + 2
 
 
 def load_openapi_specs(folder_path):
-    specs = {}
-    for filename in os.listdir(folder_path):
-        if filename.endswith((".yaml", ".yml")):
-            with open(os.path.join(folder_path, filename), "r") as f:
-                try:
-                  specs[filename] = yaml.safe_load(f)
-                except yaml.YAMLError as e:
-                    print(f"Error loading {filename}: {e}")
-    return specs
+    return spec_cache.get_cache().load_folder(folder_path, extensions=(".yaml", ".yml"))
 
 # Set the path to your folder containing OpenAPI specs
 openapi_folder = "open_api_specs" # Replace with the actual path
 openapi_specs = load_openapi_specs(openapi_folder)
 
 
-def _create_api_tool(spec_name: str, method: str, path: str, requests_wrapper: TextRequestsWrapper) -> Tool:
-    """Helper function to create a single OpenAPI tool."""
-    def _tool_func(input):
-        if not isinstance(input, dict) or "url" not in input:
-            return "Invalid input: provide a dictionary with a URL and optionally a body"
-        try:
-            url = input["url"]
-            headers = {"Content-Type":"application/json"}
-            if method == "get":
-                return requests_wrapper.get(url)
-            elif method == "post":
-                return requests_wrapper.post(url, headers=headers, data=json.dumps(input.get("body", {})))
-            elif method == "put":
-                return requests_wrapper.put(url, headers=headers, data=json.dumps(input.get("body", {})))
-            elif method == "delete":
-                return requests_wrapper.delete(url)
-            return "Invalid method"
-        except Exception as e:
-            return f"Error: {e}"
-
-    tool_name = f"API: {spec_name} - {method.upper()} {path}"
-    tool_description = f"Use this to interact with the {method.upper()} endpoint {path} of the API defined in {spec_name}. Input should be a dictionary with a url and optionally a body for POST/PUT requests."
-    return Tool(name=tool_name, func=_tool_func, description=tool_description)
-
-def create_openapi_tools(specs: Dict) -> List[Tool]:
-    """Creates a list of OpenAPI tools from a dictionary of specs."""
-    requests_wrapper = TextRequestsWrapper()
-    all_tools = []
-
-    for spec_name, spec_dict in specs.items():
+def _parse_tool_input(tool_input):
+    if isinstance(tool_input, str):
         try:
-          spec = OpenAPISpec.spec(spec_dict)
-          tools = [
-              _create_api_tool(spec_name, method, path, requests_wrapper)
-              for path, path_item in spec.paths.items()
-              for method in path_item
-              if method in ["get", "post", "put", "delete"]
-          ]
-          all_tools.extend(tools)
-
-        except Exception as e:
-            print(f"Error creating tool from {spec_name}: {e}")
-
-    return all_tools
-
-
-openapi_tools = create_openapi_tools(openapi_specs)
+            tool_input = json.loads(tool_input)
+        except ValueError:
+            tool_input = {"url": tool_input}
+    if not isinstance(tool_input, dict) or not (tool_input.get("url") or tool_input.get("path")):
+        return None
+    return tool_input
+
+
+def _create_api_tool(spec_name: str, method: str, path: str, base_url: str, executor: HttpExecutor,
+                     tool_name: str = None, cache: ResponseCache = None, cache_ttl: float = HTTP_TTL) -> Tool:
+    """Helper function to create a single OpenAPI tool with sync and async entry points.
+
+    GET responses are cached when a cache is given; other methods always hit the API.
+    """
+    if method != "get" or not cache_ttl:
+        cache = None
+
+    def _request_args(tool_input):
+        tool_input = _parse_tool_input(tool_input)
+        if tool_input is None:
+            return None
+        url = resolve_url(base_url, tool_input.get("url") or tool_input["path"])
+        body = tool_input.get("body", {}) if method in ("post", "put") else None
+        return method, url, tool_input.get("params"), body
+
+    def _tool_func(tool_input):
+        args = _request_args(tool_input)
+        if args is None:
+            return "Invalid input: provide a dictionary with a URL and optionally a body"
+        key, label = http_key(*args) if cache else (None, None)
+        cached = cache.get(key) if cache else None
+        if cached is not None:
+            return cached
+        response = executor.request(*args)
+        if cache and cacheable(response):
+            cache.set(key, response, cache_ttl, "http", label)
+        return response
+
+    async def _tool_coroutine(tool_input):
+        args = _request_args(tool_input)
+        if args is None:
+            return "Invalid input: provide a dictionary with a URL and optionally a body"
+        key, label = http_key(*args) if cache else (None, None)
+        cached = cache.get(key) if cache else None
+        if cached is not None:
+            return cached
+        response = await executor.aexecute(*args)
+        if cache and cacheable(response):
+            cache.set(key, response, cache_ttl, "http", label)
+        return response
+
+    tool_name = tool_name or f"API: {spec_name} - {method.upper()} {path}"
+    tool_description = f"Use this to interact with the {method.upper()} endpoint {path} of the API defined in {spec_name} (server {base_url}). Input should be a JSON dictionary with a url (or a path relative to the server), optional query params and optionally a body for POST/PUT requests."
+    return Tool(name=tool_name, func=_tool_func, coroutine=_tool_coroutine, description=tool_description)
+
+def create_openapi_tools(specs: Dict, extra_tools: List[Tool] = ()) -> ToolRegistry:
+    """Indexes the endpoints of a dictionary of specs; each Tool is only built when first used."""
+    executor = get_executor()
+    cache = get_response_cache()
+    return ToolRegistry(
+        specs,
+        # Operations can opt out of caching, or shorten it, with x-cache-ttl in the spec
+        lambda endpoint: _create_api_tool(endpoint.spec_name, endpoint.method, endpoint.path,
+                                          endpoint.base_url, executor, tool_name=endpoint.name, cache=cache,
+                                          cache_ttl=endpoint.operation.get("x-cache-ttl", HTTP_TTL)),
+        extra_tools=extra_tools,
+        ranker=EndpointIndex(specs).ranker,
+    )
 
 
 python_tool = PythonREPLTool()
 python_tool.description = "Use this to execute python code."
 
 
-
 # Initialize LLM, tools, and prompts
+set_llm_cache(LLMCache(get_response_cache()))
 llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, streaming=True)
-tools = [
-   python_tool,
-]
-tools.extend(openapi_tools)
+tool_registry = create_openapi_tools(openapi_specs, extra_tools=[python_tool])
 
 
 prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a helpful AI assistant, use tools to answer user questions."),
+    ("system", "You are a helpful AI assistant, use tools to answer user questions. When several independent calls are needed, request them together in one turn."),
     MessagesPlaceholder(variable_name="agent_scratchpad"),
     ("user", "{input}"),
 ])
+parser = OpenAIToolsAgentOutputParser()
+# Tool calls from one model turn run concurrently, at most TOOL_FANOUT at a time
+tool_pool = ThreadPoolExecutor(max_workers=TOOL_FANOUT, thread_name_prefix="tool")
 # Define the agent's action and response logic
 
-def format_messages(state):
-    messages = state["messages"]
-    inputs = state["input"]
-    intermediate_steps = state.get("intermediate_steps", [])
-    formatted_messages = prompt.format_messages(
-        input=inputs,
-        agent_scratchpad=format_to_openai_tool_messages(intermediate_steps, tools=list(map(convert_to_openai_tool,tools)))
-    )
-    return {"messages": formatted_messages}
+def _estimate_tokens(message):
+    return (len(str(message.content)) + len(json.dumps(getattr(message, "tool_calls", []), default=str))) // 4
+
+
+def over_budget(state):
+    return (state.get("iterations", 0) >= MAX_ITERATIONS
+            or state.get("scratchpad_tokens", 0) >= MAX_SCRATCHPAD_TOKENS)
+
 
 def run_agent(state):
-    messages = state["messages"]
-    response = llm.invoke(messages)
-    return {"response": response}
+    # The prompt is built here rather than stored in the state, so checkpoints do not carry a copy of it
+    formatted_messages = prompt.format_messages(input=state["input"], agent_scratchpad=state.get("scratchpad", []))
+    update = {"iterations": 1}
+    if over_budget(state):
+        response = llm.invoke(formatted_messages + [SystemMessage(content=BUDGET_NOTE)])
+        if response.tool_calls:
+            response = AIMessage(content=response.content or BUDGET_NOTE, id=response.id)
+        update["response"] = response
+        return update
+    # Only the endpoints relevant to this question are offered to the model
+    active_tools = state.get("active_tools")
+    if not active_tools:
+        active_tools = update["active_tools"] = tool_registry.select(state["input"])
+    # Tool schemas are converted once per process and reused on every call
+    update["response"] = llm.bind_tools(tool_registry.openai_tools(active_tools)).invoke(formatted_messages)
+    return update
 
 def parse_agent_response(state):
-  response = state["response"]
-  parser = OpenAIToolsAgentOutputParser()
-  result = parser.parse_result(response)
+  # A list of ToolAgentActions (one per tool call in the turn) or an AgentFinish
+  result = parser.invoke(state["response"])
   return {"action": result}
 
 
-def handle_tool_call(state):
-    action = state["action"]
-    if action.tool_call:
-      tool_name = action.tool_call.name
-      tool = {tool.name:tool for tool in tools}[tool_name]
-      output = tool.run(action.tool_call.arguments)
-      return {"tool_output": output, "continue": True}
-    else:
-      return {"tool_output": None, "continue": False}
-      
-def update_messages(state):
-    messages = state["messages"]
-    action = state["action"]
-    if action.tool_call:
-      messages.append(action.tool_call.message)
-      return {"messages":messages}
-    else:
-        messages.append(action.return_message)
-        return {"messages":messages}
+def _run_tool(action, config=None):
+    try:
+        tool = tool_registry.get(action.tool)
+    except KeyError:
+        return f"Error: unknown tool {action.tool}"
+    try:
+        # A call that already completed in this thread (before a crash or restart) is not run again
+        return checkpointer.run_tool(config, action.tool_call_id, action.tool, lambda: tool.run(action.tool_input))
+    except Exception as e:
+        return f"Error: {e}"
+
 
-def update_intermediate_steps(state):
-    intermediate_steps = state.get("intermediate_steps", [])
+def handle_tool_call(state, config):
     action = state["action"]
-    if action.tool_call:
-        intermediate_steps.append(action.tool_call)
-        return {"intermediate_steps":intermediate_steps}
+    if isinstance(action, AgentFinish):
+      return {"tool_outputs": [], "call_tools": False}
+    # map() keeps outputs in the order the model asked for them
+    outputs = list(tool_pool.map(lambda a: _run_tool(a, config), action))
+    # Only this turn's steps are converted; earlier ones are already in the scratchpad
+    new_messages = format_to_openai_tool_messages(list(zip(action, outputs)))
+    return {
+        "tool_outputs": outputs,
+        "call_tools": True,
+        "scratchpad": new_messages,
+        "scratchpad_tokens": sum(_estimate_tokens(m) for m in new_messages),
+        "messages": [{"role": "tool", "content": str(output), "name": a.tool} for a, output in zip(action, outputs)],
+    }
+
+def update_messages(state):
+    return {"messages": [{"role": "assistant", "content": state["action"].return_values["output"]}]}
+
+
+def build_graph(checkpointer=None):
+    workflow = StateGraph(State)
+    workflow.add_node("run_agent", run_agent)
+    workflow.add_node("parse_agent_response", parse_agent_response)
+    workflow.add_node("handle_tool_call", handle_tool_call)
+    workflow.add_node("update_messages", update_messages)
+
+    workflow.set_entry_point("run_agent")
+    workflow.add_edge("run_agent", "parse_agent_response")
+    workflow.add_edge("parse_agent_response", "handle_tool_call")
+    workflow.add_conditional_edges("handle_tool_call", lambda state: state["call_tools"],
+                                   {True: "run_agent", False: "update_messages"})
+    workflow.add_edge("update_messages", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+# Every completed node is checkpointed, so an interrupted turn resumes where it stopped
+checkpointer = get_checkpointer()
+graph = build_graph(checkpointer)
+
+
+def respond(message, history, request: gr.Request = None):
+  """Yields the reply as it is produced: tool results as they land, then the answer token by token.
+
+  Each turn of a chat session runs in its own checkpoint thread. Sending the same message again
+  after a turn was interrupted continues that turn from its last completed node.
+  """
+  events = []
+  actions = []
+  answer = ""
+  answer_id = None
+  session = request.session_hash if request is not None else "default"
+  config = {"configurable": {"thread_id": f"{session}:{len(history)}"}, "recursion_limit": RECURSION_LIMIT}
+  snapshot = graph.get_state(config)
+  if snapshot.next and snapshot.values.get("input") == message:
+    inputs = None
+  else:
+    if snapshot.values:
+      # A finished or different turn in this slot (e.g. a retry): start over
+      checkpointer.delete_thread(config["configurable"]["thread_id"])
+    inputs = {"input": message}
+  for mode, chunk in graph.stream(inputs, config, stream_mode=["messages", "updates"]):
+    if mode == "messages":
+      token, metadata = chunk
+      if metadata.get("langgraph_node") != "run_agent" or not token.content:
+        continue
+      if token.id != answer_id:
+        # A new model turn; text from an earlier turn was only a preamble to its tool calls
+        answer, answer_id = "", token.id
+      answer += token.content
+    elif "run_agent" in chunk:
+      response = chunk["run_agent"]["response"]
+      if response.content and response.id != answer_id:
+        # Served from the LLM cache, so no tokens were streamed
+        answer, answer_id = response.content, response.id
+    elif "parse_agent_response" in chunk:
+      action = chunk["parse_agent_response"]["action"]
+      if isinstance(action, AgentFinish):
+        continue
+      actions = action
+      events.extend(f"> calling {a.tool}" for a in actions)
+    elif "handle_tool_call" in chunk and chunk["handle_tool_call"]["call_tools"]:
+      for a, output in zip(actions, chunk["handle_tool_call"]["tool_outputs"]):
+        events.append(f"> {a.tool}: {str(output).strip()[:TOOL_PREVIEW_CHARS]}")
     else:
-      return {"intermediate_steps":intermediate_steps}
-
-def tool_message(state):
-    messages = state["messages"]
-    tool_output = state["tool_output"]
-    messages.append({"role":"tool", "content": str(tool_output), "name": state["action"].tool_call.name})
-    return {"messages":messages}
-
-
-# Build the LangGraph
-workflow = StateGraph(State)
-format_messages_node = workflow.add_node("format_messages", format_messages)
-run_agent_node = workflow.add_node("run_agent", run_agent)
-parse_agent_response_node = workflow.add_node("parse_agent_response", parse_agent_response)
-handle_tool_call_node = workflow.add_node("handle_tool_call", handle_tool_call)
-tool_message_node = workflow.add_node("tool_message", tool_message)
-update_messages_node = workflow.add_node("update_messages", update_messages)
-update_intermediate_steps_node = workflow.add_node("update_intermediate_steps", update_intermediate_steps)
-
-
-workflow.set_entry_point(format_messages_node)
-workflow.add_edge(format_messages_node, run_agent_node)
-workflow.add_edge(run_agent_node, parse_agent_response_node)
-workflow.add_edge(parse_agent_response_node, handle_tool_call_node)
-workflow.add_conditional_edges(handle_tool_call_node, {True: tool_message_node, False: update_messages_node})
-workflow.add_edge(tool_message_node, update_intermediate_steps_node)
-workflow.add_edge(update_intermediate_steps_node, format_messages_node)
-workflow.add_edge(update_messages_node, END)
-
-
-def respond(message, history):
-  response = graph.invoke({"input": message, "messages": []})
-  for event in response:
-    if "messages" in event and event["messages"]:
-        for message in event["messages"]:
-          if message["role"] == "assistant":
-             history.append((message["content"], None))
-          elif message["role"] == "user":
-              history.append((None, message["content"]))
-          elif message["role"] == "tool":
-            history.append((None, f"tool: {message['content']}"))
-
-  return history
+      continue
+    yield "\n\n".join(events + [answer]).strip()
 
 if __name__ == '__main__':
     iface = gr.ChatInterface(respond,
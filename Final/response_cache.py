@@ -0,0 +1,236 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+try:
+    from langchain_core.caches import BaseCache
+    from langchain_core.load import dumps, loads
+except ImportError:  # batch_service only needs the invalidation hook
+    BaseCache = object
+
+# Two-tier cache for the agents: GET tool responses and LLM completions.
+# Hot entries live in an in-process LRU; every entry is also written to SQLite so
+# other agent processes and restarts can reuse it. Invalidations are recorded in
+# the same database, which lets batch_service expire cached run status and results
+# in every agent process when a run changes state.
+
+DB_FILE = os.getenv('RESPONSE_CACHE_DB', 'response_cache.db')
+MEMORY_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 512))
+HTTP_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 300))
+LLM_TTL = float(os.getenv('LLM_CACHE_TTL', 24 * 3600))
+INVALIDATION_POLL_INTERVAL = float(os.getenv('RESPONSE_CACHE_INVALIDATION_POLL', 1.0))
+BUSY_TIMEOUT_MS = 5000
+PURGE_EVERY = 100  # sets between sweeps of expired rows
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    label TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires_at);
+CREATE TABLE IF NOT EXISTS invalidations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pattern TEXT NOT NULL,
+    at REAL NOT NULL
+);
+'''
+
+logger = logging.getLogger(__name__)
+
+
+def http_key(method, url, params=None, body=None):
+    """Normalized (key, label) for a request: query params merged and sorted, host lowercased, body canonical JSON."""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True) + sorted((params or {}).items())
+    label = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/') or '/',
+                        urlencode(sorted((str(k), str(v)) for k, v in query)), ''))
+    payload = json.dumps([method.upper(), label, body], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest(), label
+
+
+class ResponseCache:
+    def __init__(self, db_file=DB_FILE, memory_size=MEMORY_SIZE):
+        self.db_file = db_file
+        self.memory_size = memory_size
+        self.memory = collections.OrderedDict()  # key -> (value, expires_at, label)
+        self.metrics = collections.Counter()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.last_invalidation = 0
+        self.last_poll = 0.0
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.executescript(SCHEMA)
+        row = conn.execute('SELECT MAX(id) FROM invalidations').fetchone()
+        self.last_invalidation = row[0] or 0
+
+    def _conn(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT_MS / 1000)
+            conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        self._poll_invalidations()
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self.memory.move_to_end(key)
+                    self.metrics['memory_hits'] += 1
+                    return entry[0]
+                del self.memory[key]
+        try:
+            row = self._conn().execute('SELECT value, expires_at, label FROM cache WHERE key = ? AND expires_at > ?',
+                                       (key, now)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f'Response cache read failed: {e}')
+            row = None
+        with self.lock:
+            if row is None:
+                self.metrics['misses'] += 1
+                return None
+            self.metrics['disk_hits'] += 1
+            self._remember(key, *row)
+        return row[0]
+
+    def set(self, key, value, ttl, namespace, label):
+        expires_at = time.time() + ttl
+        with self.lock:
+            self._remember(key, value, expires_at, label)
+            self.metrics['stores'] += 1
+            purge = self.metrics['stores'] % PURGE_EVERY == 0
+        try:
+            with self._conn() as conn:
+                conn.execute('INSERT OR REPLACE INTO cache (key, namespace, label, value, expires_at) VALUES (?, ?, ?, ?, ?)',
+                             (key, namespace, label, value, expires_at))
+                if purge:
+                    conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+                    conn.execute('DELETE FROM invalidations WHERE at <= ?', (time.time() - 86400,))
+        except sqlite3.Error as e:
+            logger.warning(f'Response cache write failed: {e}')
+
+    def invalidate(self, pattern):
+        """Drop every entry whose label (normalized URL or model) contains pattern, in all processes."""
+        with self.lock:
+            self._drop_memory(pattern)
+            self.metrics['invalidations'] += 1
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM cache WHERE instr(label, ?) > 0", (pattern,))
+                conn.execute('INSERT INTO invalidations (pattern, at) VALUES (?, ?)', (pattern, time.time()))
+        except sqlite3.Error as e:
+            logger.warning(f'Response cache invalidation failed: {e}')
+
+    def clear(self, namespace=None):
+        with self.lock:
+            self.memory.clear()
+        with self._conn() as conn:
+            if namespace:
+                conn.execute('DELETE FROM cache WHERE namespace = ?', (namespace,))
+            else:
+                conn.execute('DELETE FROM cache')
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+            stats['memory_entries'] = len(self.memory)
+        lookups = stats.get('memory_hits', 0) + stats.get('disk_hits', 0) + stats.get('misses', 0)
+        stats['hit_rate'] = (lookups - stats.get('misses', 0)) / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key, value, expires_at, label):
+        self.memory[key] = (value, expires_at, label)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+            self.metrics['evictions'] += 1
+
+    def _drop_memory(self, pattern):
+        for key in [k for k, (_, _, label) in self.memory.items() if pattern in label]:
+            del self.memory[key]
+
+    def _poll_invalidations(self):
+        # Invalidations made by other processes reach our memory tier within INVALIDATION_POLL_INTERVAL
+        now = time.monotonic()
+        if now - self.last_poll < INVALIDATION_POLL_INTERVAL:
+            return
+        self.last_poll = now
+        try:
+            rows = self._conn().execute('SELECT id, pattern FROM invalidations WHERE id > ? ORDER BY id',
+                                        (self.last_invalidation,)).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f'Response cache invalidation poll failed: {e}')
+            return
+        with self.lock:
+            for invalidation_id, pattern in rows:
+                self._drop_memory(pattern)
+                self.last_invalidation = max(self.last_invalidation, invalidation_id)
+
+
+class LLMCache(BaseCache):
+    """LangChain cache adapter: completions keyed by prompt and model settings."""
+
+    def __init__(self, cache, ttl=LLM_TTL):
+        self.cache = cache
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        return hashlib.sha256(f'{llm_string}\x00{prompt}'.encode()).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        value = self.cache.get(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # loads() is flagged as beta
+            return [loads(generation) for generation in json.loads(value)]
+
+    def update(self, prompt, llm_string, return_val):
+        value = json.dumps([dumps(generation) for generation in return_val])
+        self.cache.set(self._key(prompt, llm_string), value, self.ttl, 'llm', llm_string[:200])
+
+    def clear(self, **kwargs):
+        self.cache.clear('llm')
+
+
+def cacheable(response):
+    """Only successful responses are stored; errors and non-2xx statuses are always re-fetched."""
+    return not response.startswith(('Error:', 'HTTP '))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide ResponseCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def invalidate_run(run_id, cob_date=None):
+    """Hook for batch_service: forget cached status for run_id, and cached results for its cob date."""
+    cache = get_cache()
+    cache.invalidate(run_id)
+    if cob_date:
+        cache.invalidate(cob_date)
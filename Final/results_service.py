@@ -1,8 +1,11 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_restx import Api, Resource
 import os
+import mimetypes
 import yaml
-from urllib.parse import urljoin
+import dataset_files
+import results_store
+from urllib.parse import urlencode, urljoin
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
@@ -20,6 +23,15 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 DATASETS_DIR = os.path.join(BASE_DIR, "Datasets")
 DS1_PATH = os.path.join(DATASETS_DIR, "CCAR_Results.xlsx")
 DS2_PATH = os.path.join(DATASETS_DIR, "CECL_Results.xlsx")
+DATASETS = {'stress': DS1_PATH, 'allowance': DS2_PATH}
+columnar = results_store.ColumnarCache(DATASETS_DIR)
+downloads = dataset_files.DatasetFiles(DATASETS_DIR)
+
+
+def query_link(dataset):
+    """URL of the filtered query for the current request's runtype/cob/scenario."""
+    params = urlencode([(name, request.args[name]) for name in results_store.FILTER_COLUMNS if request.args.get(name)])
+    return f"{request.url_root.rstrip('/')}{excel_ns.path}/query/{dataset}" + (f'?{params}' if params else '')
 
 
 
@@ -37,7 +49,7 @@ class StressResults(Resource):
         # Construct full URL for the file
         file_url = urljoin(base_url.replace('/stressResults', ''), f'download/{secure_filename("CCAR_Results.xlsx")}')
         
-        return {'link': file_url}, 200
+        return {'link': file_url, 'query': query_link('stress')}, 200
 
 
 @excel_ns.route('/allowanceResults')
@@ -54,7 +66,36 @@ class AllowanceResults(Resource):
         # Construct full URL for the file
         file_url = urljoin(base_url.replace('/allowanceResults', ''), f'download/{secure_filename("CECL_Results.xlsx")}')
         
-        return {'link': file_url}, 200
+        return {'link': file_url, 'query': query_link('allowance')}, 200
+
+
+@excel_ns.route('/query/<string:dataset>')
+class QueryResults(Resource):
+    @excel_ns.doc(description="Query rows of a results dataset")
+    def get(self, dataset):
+        """Filtered, paginated rows of a dataset without downloading the workbook."""
+        file_path = DATASETS.get(dataset)
+        if file_path is None or not os.path.exists(file_path):
+            return {'message': 'Dataset not found'}, 404
+        try:
+            limit = min(int(request.args.get('limit', results_store.DEFAULT_PAGE_SIZE)), results_store.MAX_PAGE_SIZE)
+            offset = int(request.args.get('offset', 0))
+            if limit < 1 or offset < 0:
+                raise ValueError('limit must be positive and offset not negative')
+            columns = [c.strip() for c in request.args.get('columns', '').split(',') if c.strip()]
+            filters = {name: request.args.get(name) for name in results_store.FILTER_COLUMNS}
+            table = columnar.query(file_path, filters, columns)
+        except ValueError as e:
+            return {'message': str(e), 'columns': columnar.columns(file_path)}, 400
+
+        rows = table.slice(offset, limit)
+        if request.args.get('format', 'json') == 'csv':
+            response = Response(stream_with_context(results_store.stream_csv(rows)), mimetype='text/csv')
+        else:
+            response = Response(stream_with_context(results_store.stream_json(rows, table.num_rows, offset)),
+                                mimetype='application/json')
+        response.headers['X-Total-Count'] = str(table.num_rows)
+        return response
 
 
 @app.route('/download/<filename>')
@@ -69,7 +110,17 @@ def download_file(filename):
 
     if not os.path.exists(file_path):
         return "File Not Found", 404
-    return send_file(file_path, as_attachment=True)
+    etag, mtime = downloads.info(file_path)
+    encoding, send_path = downloads.variant(file_path, etag, request.headers.get('Accept-Encoding'))
+    # conditional=True answers If-None-Match/If-Modified-Since with 304 and Range with 206/416.
+    # Each encoding is a different representation, so it gets its own ETag.
+    response = send_file(send_path, mimetype=mimetypes.guess_type(filename)[0], as_attachment=True,
+                         download_name=filename, etag=f'{etag}-{encoding}' if encoding else etag,
+                         last_modified=mtime, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 
 if __name__ == '__main__':
@@ -0,0 +1,150 @@
+import glob
+import io
+import json
+import os
+import re
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+# Columnar copies of the result workbooks.
+# Parsing xlsx is slow, so each workbook is converted to Parquet once per
+# (mtime, size) and queries read only the requested columns and the row groups
+# that can match the filters. The Parquet files live in CACHE_DIR_NAME next to
+# the datasets, so every worker process and restart reuses them.
+
+CACHE_DIR_NAME = '.columnar'
+ROW_GROUP_SIZE = int(os.getenv('RESULTS_ROW_GROUP_SIZE', 10000))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.getenv('RESULTS_MAX_PAGE_SIZE', 10000))
+
+# Query parameter -> column names it may appear under in the workbooks
+FILTER_COLUMNS = {
+    'runtype': ('runtype', 'run_type', 'type'),
+    'cob': ('cob', 'cob_date', 'cobdate'),
+    'scenario': ('scenario', 'run_scenario'),
+}
+
+
+def normalize_cob(value):
+    """COB dates compare as YYYYMMDD whether they were written 2024-07-24, 2024/07/24, 20240724 or as an Excel date."""
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y%m%d')
+    digits = re.sub(r'\D', '', str(value))
+    return digits if len(digits) == 8 else str(value)
+
+
+class ColumnarCache:
+    def __init__(self, datasets_dir):
+        self.cache_dir = os.path.join(datasets_dir, CACHE_DIR_NAME)
+        self.tables = {}  # workbook path -> ((mtime_ns, size), parquet path, schema, filter columns)
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def _entry(self, path):
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        entry = self.tables.get(path)
+        if entry is not None and entry[0] == key:
+            return entry
+        with self.lock:
+            lock = self.locks.setdefault(path, threading.Lock())
+        with lock:
+            entry = self.tables.get(path)
+            if entry is None or entry[0] != key:
+                parquet_path = self._build(path, key)
+                schema = pq.read_schema(parquet_path)
+                entry = self.tables[path] = (key, parquet_path, schema, self._filter_columns(schema.names))
+        return entry
+
+    def _build(self, path, key):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        parquet_path = os.path.join(self.cache_dir, f'{stem}-{key[0]}-{key[1]}.parquet')
+        if os.path.exists(parquet_path):
+            return parquet_path
+        frame = pd.read_excel(path)
+        for column in frame.columns:
+            if frame[column].dtype == object:
+                # Workbook columns often mix numbers and text; Arrow needs one type per column
+                frame[column] = frame[column].map(lambda v: None if pd.isna(v) else str(v))
+        for param, column in self._filter_columns(frame.columns).items():
+            values = frame[column]
+            if param == 'cob':
+                values = values.map(lambda v: None if pd.isna(v) else normalize_cob(v))
+            frame[column] = values.astype('string')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f'{parquet_path}.{os.getpid()}.tmp'
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), tmp_path, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, parquet_path)
+        # Older versions of this workbook are no longer needed
+        for stale in glob.glob(os.path.join(self.cache_dir, f'{glob.escape(stem)}-*.parquet')):
+            if stale != parquet_path:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+        return parquet_path
+
+    @staticmethod
+    def _filter_columns(names):
+        by_name = {str(name).strip().lower(): name for name in names}
+        found = {}
+        for param, aliases in FILTER_COLUMNS.items():
+            for alias in aliases:
+                if alias in by_name:
+                    found[param] = by_name[alias]
+                    break
+        return found
+
+    def columns(self, path):
+        return self._entry(path)[2].names
+
+    def query(self, path, filters=None, columns=None):
+        """Arrow table of the rows matching filters ({param: value}), with only the given columns.
+
+        Raises ValueError for unknown columns or filters the workbook has no column for.
+        """
+        _, parquet_path, schema, filter_columns = self._entry(path)
+        if columns:
+            unknown = [c for c in columns if c not in schema.names]
+            if unknown:
+                raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+        predicates = []
+        for param, value in (filters or {}).items():
+            if value in (None, ''):
+                continue
+            if param not in filter_columns:
+                raise ValueError(f"Dataset has no column for {param}")
+            predicates.append((filter_columns[param], '=', normalize_cob(value) if param == 'cob' else str(value)))
+        return pq.read_table(parquet_path, columns=columns or None, filters=predicates or None, memory_map=True)
+
+
+def stream_json(table, total, offset):
+    """{"columns", "total", "offset", "next_offset", "rows"} with rows written batch by batch."""
+    next_offset = offset + table.num_rows if offset + table.num_rows < total else None
+    head = {'columns': table.column_names, 'total': total, 'offset': offset, 'next_offset': next_offset}
+    yield json.dumps(head)[:-1] + ', "rows": ['
+    first = True
+    for batch in table.to_batches():
+        rows = batch.to_pylist()
+        if not rows:
+            continue
+        chunk = ', '.join(json.dumps(row, default=str) for row in rows)
+        yield chunk if first else ', ' + chunk
+        first = False
+    yield ']}'
+
+
+def stream_csv(table):
+    sink = io.BytesIO()
+    with pa_csv.CSVWriter(sink, table.schema) as writer:
+        for batch in table.to_batches():
+            writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    if sink.getvalue():
+        yield sink.getvalue()
@@ -0,0 +1,67 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SLOTS = int(os.getenv('RUN_SLOTS', 4))
+MAX_PENDING = int(os.getenv('RUN_MAX_PENDING', 100))
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when every slot is busy and the pending queue is full."""
+
+
+class RunExecutor:
+    """Runs jobs on a fixed number of slots with a bounded pending queue.
+
+    Each job receives a threading.Event as its last argument and is expected
+    to check it (e.g. by sleeping with cancel.wait()) so a cancel ends the
+    work and frees the slot.
+    """
+
+    def __init__(self, slots=SLOTS, max_pending=MAX_PENDING):
+        self.slots = slots
+        self.pool = ThreadPoolExecutor(max_workers=slots, thread_name_prefix='run')
+        self.capacity = threading.BoundedSemaphore(slots + max_pending)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, run_id, fn, *args):
+        if not self.capacity.acquire(blocking=False):
+            raise QueueFullError(f'All {self.slots} slots busy and pending queue full')
+        cancel = threading.Event()
+        try:
+            future = self.pool.submit(fn, *args, cancel)
+        except Exception:
+            self.capacity.release()
+            raise
+        with self.lock:
+            self.jobs[run_id] = (future, cancel)
+        future.add_done_callback(lambda f: self._done(run_id, f))
+        return future
+
+    def _done(self, run_id, future):
+        with self.lock:
+            self.jobs.pop(run_id, None)
+        self.capacity.release()
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f'Run {run_id} failed: {future.exception()!r}')
+
+    def cancel(self, run_id):
+        """Cancel a job. Returns True if it never started, False if it was signalled to stop, None if unknown."""
+        with self.lock:
+            job = self.jobs.get(run_id)
+        if job is None:
+            return None
+        future, cancel = job
+        cancel.set()
+        return future.cancel()
+
+    def shutdown(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for future, cancel in jobs:
+            cancel.set()
+        self.pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,242 @@
+import collections
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import psutil
+
+# Run registry for batch_service.
+# SQLite is the source of truth, so runs survive restarts and every gunicorn
+# worker sees the same state. Runs this process is executing stay pinned in
+# memory; finished runs are kept in a small LRU until their TTL runs out.
+# Every run records the pid and start time of the process executing it, so runs
+# left unfinished by a process that has since died are marked failed on startup,
+# even when a new process has been given the same pid.
+
+DB_FILE = os.getenv('RUN_STORE_DB', 'batch_runs.db')
+BUSY_TIMEOUT_MS = int(os.getenv('RUN_STORE_BUSY_TIMEOUT_MS', 5000))
+CACHE_SIZE = int(os.getenv('RUN_CACHE_SIZE', 1024))
+CACHE_TTL = float(os.getenv('RUN_CACHE_TTL', 3600))
+
+TERMINAL_STATES = ('completed', 'killed', 'failed')
+ACTIVE_STATES = ('queued', 'running', 'cancelling')
+# States a run may move to each status from; terminal statuses are final
+PREVIOUS_STATES = {
+    'running': ('queued',),
+    'cancelling': ('queued', 'running'),
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    log_file TEXT NOT NULL,
+    run_type TEXT,
+    run_scenario TEXT,
+    cob_date TEXT,
+    run_group TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner_pid INTEGER,
+    owner_started REAL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_status ON runs (status, updated_at);
+'''
+COLUMNS = ('run_id', 'status', 'log_file', 'run_type', 'run_scenario', 'cob_date', 'run_group')
+INSERT_RUN = '''INSERT INTO runs (run_id, status, log_file, run_type, run_scenario, cob_date, run_group,
+                                  created_at, updated_at, owner_pid, owner_started)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+UPDATE_STATUS = 'UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ? AND status IN ({})'
+SELECT_RUN = f'SELECT {", ".join(COLUMNS)} FROM runs WHERE run_id = ?'
+SELECT_STATUS = 'SELECT status FROM runs WHERE run_id = ?'
+SELECT_STATUSES = 'SELECT run_id, status FROM runs WHERE run_id IN ({})'
+SELECT_OWNERS = f'SELECT run_id, owner_pid, owner_started FROM runs WHERE status IN {ACTIVE_STATES}'
+DELETE_RUN = 'DELETE FROM runs WHERE run_id = ?'
+
+logger = logging.getLogger(__name__)
+
+
+class Run:
+    __slots__ = ('run_id', 'status', 'log_file', 'run_type', 'run_scenario', 'cob_date', 'run_group', 'log')
+
+    def __init__(self, run_id, run_type, run_scenario, cob_date, run_group, status="queued", log_file=None):
+        self.run_id = run_id
+        self.status = status
+        self.log_file = log_file or f"run_{run_id}.log"  # Simple log file path
+        self.run_type = run_type
+        self.run_scenario = run_scenario
+        self.cob_date = cob_date
+        self.run_group = run_group
+        self.log = None
+
+
+class SQLiteRunStore:
+    """On-disk backend: one WAL-mode connection per thread."""
+
+    def __init__(self, db_file=DB_FILE):
+        self.db_file = db_file
+        self.local = threading.local()
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.executescript(SCHEMA)
+        for column in ('owner_pid INTEGER', 'owner_started REAL'):
+            try:
+                conn.execute(f'ALTER TABLE runs ADD COLUMN {column}')  # databases from before the owner columns
+            except sqlite3.OperationalError:
+                pass  # already there
+        self.fail_orphaned()
+
+    def _conn(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT_MS / 1000)
+            conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def add(self, run):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(INSERT_RUN, (run.run_id, run.status, run.log_file, run.run_type, run.run_scenario,
+                                      run.cob_date, run.run_group, now, now, os.getpid(), _started(os.getpid())))
+
+    def set_status(self, run_id, status):
+        """Move run_id to status if its current status allows it. Returns whether it did."""
+        previous = PREVIOUS_STATES.get(status, ACTIVE_STATES)
+        with self._conn() as conn:
+            cur = conn.execute(UPDATE_STATUS.format(', '.join('?' * len(previous))),
+                               (status, time.time(), run_id, *previous))
+        return cur.rowcount > 0
+
+    def get(self, run_id):
+        row = self._conn().execute(SELECT_RUN, (run_id,)).fetchone()
+        if row is None:
+            return None
+        run_id, status, log_file, run_type, run_scenario, cob_date, run_group = row
+        return Run(run_id, run_type, run_scenario, cob_date, run_group, status=status, log_file=log_file)
+
+    def get_status(self, run_id):
+        row = self._conn().execute(SELECT_STATUS, (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_statuses(self, run_ids):
+        """{run_id: status} for the given runs that exist."""
+        sql = SELECT_STATUSES.format(', '.join('?' * len(run_ids)))
+        return dict(self._conn().execute(sql, list(run_ids)).fetchall())
+
+    def data_version(self):
+        """Changes whenever another connection commits to the database; see PRAGMA data_version."""
+        return self._conn().execute('PRAGMA data_version').fetchone()[0]
+
+    def remove(self, run_id):
+        with self._conn() as conn:
+            conn.execute(DELETE_RUN, (run_id,))
+
+    def fail_orphaned(self):
+        """Mark unfinished runs whose executing process is gone as failed. Returns their ids."""
+        owners = self._conn().execute(SELECT_OWNERS).fetchall()
+        orphaned = [run_id for run_id, pid, started in owners if not _alive(pid, started)]
+        for run_id in orphaned:
+            if self.set_status(run_id, 'failed'):
+                logger.warning(f'Run {run_id} failed: the process executing it is no longer running')
+        return orphaned
+
+
+def _started(pid):
+    """Start time of process pid, or None if there is no such process."""
+    try:
+        return psutil.Process(pid).create_time()
+    except psutil.Error:
+        return None
+
+
+def _alive(pid, started):
+    """True if process pid is still the one that started at started (both as recorded with the run)."""
+    if pid is None or started is None:
+        return False  # recorded before owner_started existed; such a process cannot still be running its runs
+    current = _started(pid)
+    # A pid taken over by a newer process (after a restart, or pid 1 in a new container) starts later
+    return current is not None and abs(current - started) < 1
+
+
+class CachedRunStore:
+    """Keeps this process's active runs and an LRU of finished runs in front of a backend."""
+
+    def __init__(self, backend, capacity=CACHE_SIZE, ttl=CACHE_TTL):
+        self.backend = backend
+        self.capacity = capacity
+        self.ttl = ttl
+        self.active = {}
+        self.finished = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, run):
+        """Register a run executed by this process. It stays in memory until it finishes."""
+        self.backend.add(run)
+        with self.lock:
+            self.active[run.run_id] = run
+
+    def remove(self, run_id):
+        with self.lock:
+            self.active.pop(run_id, None)
+            self.finished.pop(run_id, None)
+        self.backend.remove(run_id)
+
+    def set_status(self, run, status):
+        """Move run to status if its current status allows it. Returns whether it did."""
+        if self.backend.set_status(run.run_id, status):
+            run.status = status
+        else:
+            # Refused: another request or worker moved the run first
+            run.status = self.backend.get_status(run.run_id) or run.status
+        if run.status in TERMINAL_STATES:
+            with self.lock:
+                if self.active.pop(run.run_id, None) is not None:
+                    self._cache(run)
+        return run.status == status
+
+    def get(self, run_id):
+        with self.lock:
+            run = self.active.get(run_id)
+            if run is not None:
+                return run
+            entry = self.finished.get(run_id)
+            if entry is not None:
+                run, cached_at = entry
+                if time.monotonic() - cached_at < self.ttl:
+                    self.finished.move_to_end(run_id)
+                    return run
+                del self.finished[run_id]
+        # Unknown here, or owned by another worker: the backend has the latest state
+        run = self.backend.get(run_id)
+        if run is not None and run.status in TERMINAL_STATES:
+            with self.lock:
+                self._cache(run)
+        return run
+
+    def get_status(self, run_id):
+        """Latest status, reading through to the backend for runs this process does not own."""
+        with self.lock:
+            run = self.active.get(run_id)
+        if run is not None:
+            return run.status
+        run = self.get(run_id)
+        return run.status if run else None
+
+    def cancel_requested(self, run_id):
+        """True once any worker has asked for run_id to be cancelled."""
+        return self.backend.get_status(run_id) == 'cancelling'
+
+    def _cache(self, run):
+        self.finished[run.run_id] = (run, time.monotonic())
+        self.finished.move_to_end(run.run_id)
+        now = time.monotonic()
+        while self.finished:
+            oldest_id, (_, cached_at) = next(iter(self.finished.items()))
+            if len(self.finished) <= self.capacity and now - cached_at < self.ttl:
+                break
+            del self.finished[oldest_id]
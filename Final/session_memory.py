@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import get_buffer_string
+from pydantic import PrivateAttr
+
+# Per-session chat memory for the agents.
+# Each chat session keeps its recent turns verbatim up to HISTORY_TOKENS; older
+# turns are folded into a rolling summary, one batch of pruned turns at a time,
+# so the history in the prompt stays about the same size however long the chat
+# runs. Summarising happens on a background thread after the answer has been
+# returned; the summaries of one session are applied in order, and loading the
+# memory (sync or async) waits for them. Sessions idle for longer than
+# IDLE_SECONDS, or beyond the MAX_SESSIONS most recently used, are dropped.
+
+HISTORY_TOKENS = int(os.getenv('CHAT_HISTORY_TOKENS', 1500))
+MAX_SESSIONS = int(os.getenv('CHAT_MAX_SESSIONS', 200))
+IDLE_SECONDS = float(os.getenv('CHAT_IDLE_SECONDS', 3600))
+SUMMARY_WORKERS = int(os.getenv('CHAT_SUMMARY_WORKERS', 4))
+
+logger = logging.getLogger(__name__)
+summary_pool = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix='summary')
+
+
+class SessionMemory(ConversationSummaryBufferMemory):
+    """ConversationSummaryBufferMemory that counts each message once and summarises in the background."""
+
+    _token_counts: list = PrivateAttr(default_factory=list)
+    _pruning: object = PrivateAttr(default=None)
+
+    def count_tokens(self, message):
+        text = get_buffer_string([message], human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        try:
+            return self.llm.get_num_tokens(text)
+        except Exception:  # tokenizer unavailable
+            return len(text) // 4
+
+    def _pop_over_budget(self):
+        """Remove and return the oldest messages until the verbatim window fits HISTORY_TOKENS."""
+        messages = self.chat_memory.messages
+        counts = self._token_counts
+        counts.extend(self.count_tokens(m) for m in messages[len(counts):])
+        total = sum(counts)
+        pruned = []
+        while total > self.max_token_limit and messages:
+            pruned.append(messages.pop(0))
+            total -= counts.pop(0)
+        return pruned
+
+    def prune(self):
+        pruned = self._pop_over_budget()
+        if pruned:
+            self.moving_summary_buffer = self.predict_new_summary(pruned, self.moving_summary_buffer)
+
+    def _prune_later(self):
+        # The turns leave the window now; folding them into the summary can wait until the next load
+        pruned = self._pop_over_budget()
+        if pruned:
+            self._pruning = summary_pool.submit(self._summarize, pruned, self._pruning)
+
+    def _summarize(self, pruned, previous):
+        # Each summary builds on the one before it, so they are applied in the order the turns were pruned
+        if previous is not None:
+            previous.exception()
+        try:
+            self.moving_summary_buffer = self.predict_new_summary(pruned, self.moving_summary_buffer)
+        except Exception as e:  # keep the older summary rather than failing the chat
+            logger.warning(f"Could not summarise {len(pruned)} pruned messages: {e}")
+
+    def wait_for_summary(self):
+        """Block until every pending summary of this session has been applied."""
+        pending = self._pruning
+        if pending is not None:
+            pending.exception()
+
+    async def await_summary(self):
+        """wait_for_summary for coroutines, without blocking the event loop."""
+        pending = self._pruning
+        if pending is not None:
+            await asyncio.wrap_future(pending)
+
+    def save_context(self, inputs, outputs):
+        # AgentExecutor saves through the sync method even when it is streamed
+        BaseChatMemory.save_context(self, inputs, outputs)
+        self._prune_later()
+
+    async def asave_context(self, inputs, outputs):
+        await BaseChatMemory.asave_context(self, inputs, outputs)
+        self._prune_later()
+
+    def load_memory_variables(self, inputs):
+        # Also reached from astream_events, through Chain.prep_inputs; await_summary first to keep the loop free
+        self.wait_for_summary()
+        return super().load_memory_variables(inputs)
+
+    async def aload_memory_variables(self, inputs):
+        await self.await_summary()
+        return await super().aload_memory_variables(inputs)
+
+    def clear(self):
+        self.wait_for_summary()
+        super().clear()
+        self._token_counts.clear()
+
+
+class SessionMemories:
+    """SessionMemory per chat session id, least recently used first out."""
+
+    def __init__(self, llm, max_sessions=MAX_SESSIONS, idle_seconds=IDLE_SECONDS, max_token_limit=HISTORY_TOKENS,
+                 **memory_kwargs):
+        self.llm = llm
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_token_limit = max_token_limit
+        self.memory_kwargs = memory_kwargs
+        self.sessions = OrderedDict()  # session id -> (last used, SessionMemory)
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.sessions.pop(session_id, None)
+            memory = entry[1] if entry is not None else SessionMemory(
+                llm=self.llm, max_token_limit=self.max_token_limit, **self.memory_kwargs)
+            self.sessions[session_id] = (now, memory)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+            while self.sessions:
+                oldest_id, (last_used, _) = next(iter(self.sessions.items()))
+                if now - last_used <= self.idle_seconds:
+                    break
+                del self.sessions[oldest_id]
+        return memory
+
+    def __len__(self):
+        return len(self.sessions)
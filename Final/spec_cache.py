@@ -0,0 +1,88 @@
+import hashlib
+import os
+import pickle
+import threading
+
+import yaml
+
+# Parsed OpenAPI specs, shared by the agents.
+# A file is only re-read when its mtime or size changes; it is then hashed and
+# the parsed form is loaded from CACHE_DIR/<sha256>.pickle, so YAML parsing only
+# happens the first time a given spec content is seen. Returned specs are shared
+# between callers and must be treated as read-only.
+
+CACHE_DIR = os.getenv('SPEC_CACHE_DIR', '.spec_cache')
+SPEC_EXTENSIONS = ('.yaml', '.yml', '.json')
+
+
+class SpecCache:
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def load(self, path):
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == key:
+                return entry[2]
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if entry is not None and entry[1] == digest:
+            spec = entry[2]  # touched but unchanged
+        else:
+            spec = self._load_parsed(digest, content)
+        with self.lock:
+            self.entries[path] = (key, digest, spec)
+        return spec
+
+    def load_folder(self, folder_path, extensions=SPEC_EXTENSIONS):
+        """Load every spec in a folder, keyed by filename. Files that fail to parse are skipped."""
+        specs = {}
+        for filename in sorted(os.listdir(folder_path)):
+            if filename.endswith(extensions):
+                try:
+                    specs[filename] = self.load(os.path.join(folder_path, filename))
+                except Exception as e:
+                    print(f"Error loading {filename}: {e}")
+        return specs
+
+    def _load_parsed(self, digest, content):
+        pickle_path = os.path.join(self.cache_dir, f'{digest}.pickle')
+        try:
+            with open(pickle_path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+        # JSON is a subset of YAML, so one parser covers both
+        spec = yaml.safe_load(content)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f'{pickle_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(spec, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, pickle_path)
+        except OSError as e:
+            print(f"Could not write spec cache {pickle_path}: {e}")
+        return spec
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide SpecCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SpecCache()
+        return _cache
+
+
+def load_specs(folder_path):
+    return get_cache().load_folder(folder_path)
@@ -1,39 +1,79 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Literal
+
 from langchain_core.messages import HumanMessage
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import create_react_agent
+from langgraph.types import Command
+
+from py_exec import python_repl_tool, tavily_tool
+from supervisor import State, llm, supervisor_node
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from checkpointing import get_checkpointer, memoized_tool  # noqa: E402
+
+MAX_PARALLEL_WORKERS = int(os.getenv('SUPERVISOR_MAX_PARALLEL', 2))
+WORKER_TIMEOUT = float(os.getenv('SUPERVISOR_WORKER_TIMEOUT', 180))
+
+# Workers the supervisor fans out run here, at most MAX_PARALLEL_WORKERS at a time
+worker_pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_WORKERS, thread_name_prefix="worker")
+
+
+def run_worker(agent, name, state, config):
+    """The agent's answer as a message for the supervisor, or a note that it ran out of time.
+
+    The timeout starts when the agent starts, not while it waits for a pool thread, and a
+    worker that runs out of time stops after the step it is in, freeing its thread.
+    """
+    started, cancelled = threading.Event(), threading.Event()
+    # copy_context keeps the parent run's callbacks and checkpointer visible in the pool thread
+    future = worker_pool.submit(contextvars.copy_context().run, _stream_agent, agent, state, config, started,
+                                cancelled)
+    started.wait()
+    try:
+        final = future.result(timeout=WORKER_TIMEOUT)
+    except FutureTimeout:
+        cancelled.set()
+        final = None
+    if final is None:
+        content = f"The {name} did not answer within {WORKER_TIMEOUT:g}s."
+    else:
+        content = final["messages"][-1].content
+    return Command(update={"messages": [HumanMessage(content=content, name=name)]}, goto="supervisor")
+
+
+def _stream_agent(agent, state, config, started, cancelled):
+    # Runs in the pool; the agent's final state, or None when it was stopped between steps
+    deadline = time.monotonic() + WORKER_TIMEOUT
+    started.set()
+    final = None
+    for final in agent.stream(state, config, stream_mode="values"):
+        if cancelled.is_set() or time.monotonic() >= deadline:
+            return None
+    return final
 
 
 research_agent = create_react_agent(
-    llm, tools=[tavily_tool], prompt="You are a researcher. DO NOT do any math."
+    llm, tools=[memoized_tool(tavily_tool)], prompt="You are a researcher. DO NOT do any math."
 )
 
 
-def research_node(state: State) -> Command[Literal["supervisor"]]:
-    result = research_agent.invoke(state)
-    return Command(
-        update={
-            "messages": [
-                HumanMessage(content=result["messages"][-1].content, name="researcher")
-            ]
-        },
-        goto="supervisor",
-    )
+def research_node(state: State, config) -> Command[Literal["supervisor"]]:
+    # The thread id in config keys the memoized tool results
+    return run_worker(research_agent, "researcher", state, config)
 
 
 # NOTE: THIS PERFORMS ARBITRARY CODE EXECUTION, WHICH CAN BE UNSAFE WHEN NOT SANDBOXED
-code_agent = create_react_agent(llm, tools=[python_repl_tool])
+code_agent = create_react_agent(llm, tools=[memoized_tool(python_repl_tool)])
 
 
-def code_node(state: State) -> Command[Literal["supervisor"]]:
-    result = code_agent.invoke(state)
-    return Command(
-        update={
-            "messages": [
-                HumanMessage(content=result["messages"][-1].content, name="coder")
-            ]
-        },
-        goto="supervisor",
-    )
+def code_node(state: State, config) -> Command[Literal["supervisor"]]:
+    return run_worker(code_agent, "coder", state, config)
 
 
 builder = StateGraph(State)
@@ -41,4 +81,6 @@ builder.add_edge(START, "supervisor")
 builder.add_node("supervisor", supervisor_node)
 builder.add_node("researcher", research_node)
 builder.add_node("coder", code_node)
-graph = builder.compile()
\ No newline at end of file
+# Run with config={"configurable": {"thread_id": ...}}; an interrupted conversation resumes from its
+# last completed node when the same thread is streamed again with None as input
+graph = builder.compile(checkpointer=get_checkpointer())
@@ -0,0 +1,196 @@
+import logging
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+# Tiered routing for the supervisor.
+# Most hops can be decided without a model call: keyword rules say which
+# workers the latest request needs, and once those workers have answered it
+# the turn is finished. Requests the rules cannot place go to an
+# optional local text classifier (ROUTER_LOCAL_MODEL) and then to the LLM.
+# Decisions are cached per normalized request and progress, and every decision
+# is counted by the tier that made it. A request made of independent parts for
+# different workers is split so the workers can run at the same time.
+
+CACHE_SIZE = int(os.getenv('ROUTER_CACHE_SIZE', 1000))
+LOCAL_MODEL = os.getenv('ROUTER_LOCAL_MODEL')  # Hugging Face text-classification model, labels researcher/coder
+LOCAL_THRESHOLD = float(os.getenv('ROUTER_LOCAL_THRESHOLD', 0.9))
+LOG_EVERY = 100  # decisions between metric log lines
+FINISH = "FINISH"
+TIERS = ("cache", "rules", "local", "llm")
+
+# Phrases that on their own say which worker a request needs. Only wording that is
+# unambiguous belongs here; anything else is left to the model tiers.
+RULES = {
+    "coder": re.compile(
+        r"\b(calculate|compute|python|(write|run|execute) (some |a |the |this )?(code|script)|plot (a|the|of)|"
+        r"(bar|line|pie) chart|square root|standard deviation)\b"),
+    "researcher": re.compile(
+        r"\b(search (for|the web|online)|look up|find out|web search|latest news|news (about|on)|"
+        r"research)\b"),
+}
+
+# Request parts: sentences, or clauses joined by 'also' and the like
+PART_SEPARATOR = re.compile(r"(?<=[.?!;])\s+|\s*\b(?:and also|also|additionally|as well as)\b\s*", re.IGNORECASE)
+# Wording that makes one part depend on the result of another
+DEPENDENCY = re.compile(r"\b(then|using|based on|from (that|this|it|those|the results?)|with (that|those|the results?)|"
+                        r"use (that|it|those|the results?))\b", re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text):
+    """Requests that differ only in case, spacing, punctuation or numbers share a cache entry."""
+    text = re.sub(r"\d+(\.\d+)?", "#", str(text).lower())
+    return " ".join(re.sub(r"[^\w#]+", " ", text).split())
+
+
+def needed_workers(request):
+    """Workers the rules say request needs, in the order they should run, or None when no rule matches.
+
+    Bare arithmetic is left to the model tiers, since dates and ids look like it:
+
+    >>> needed_workers("what was the status of the run on 2024-07-24?") is None
+    True
+    >>> needed_workers("show results for cob 2024-03-31") is None
+    True
+    >>> needed_workers("Look up the GDP of Japan and calculate its square root")
+    ['researcher', 'coder']
+    """
+    text = str(request).lower()
+    needed = [worker for worker, pattern in RULES.items() if pattern.search(text)]
+    if not needed:
+        return None
+    # Facts have to be found before anything is computed from them
+    return sorted(needed, key=lambda worker: worker != "researcher")
+
+
+def independent_parts(request):
+    """{worker: its part of request} when request splits into parts for different workers that do not
+    depend on each other, else None."""
+    request = str(request)
+    if DEPENDENCY.search(request):
+        return None
+    tasks = {}
+    for part in PART_SEPARATOR.split(request):
+        part = (part or "").strip(" ,.;")
+        if not part:
+            continue
+        needed = needed_workers(part)
+        if needed is None or len(needed) != 1:
+            return None
+        tasks.setdefault(needed[0], []).append(part)
+    if len(tasks) < 2:
+        return None
+    return {worker: ". ".join(parts) for worker, parts in tasks.items()}
+
+
+def _local_classifier():
+    if not LOCAL_MODEL:
+        return None
+    try:
+        from transformers import pipeline
+    except ImportError:
+        logger.warning("ROUTER_LOCAL_MODEL is set but transformers is not installed; skipping the local tier")
+        return None
+    return pipeline("text-classification", model=LOCAL_MODEL)
+
+
+class TieredRouter:
+    def __init__(self, members, llm_route, classifier=None, cache_size=CACHE_SIZE):
+        """llm_route(messages) -> one of members or FINISH; called only when the cheaper tiers cannot decide."""
+        self.members = list(members)
+        self.llm_route = llm_route
+        self.classifier = classifier if classifier is not None else _local_classifier()
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.metrics = Counter()
+        self.lock = threading.Lock()
+
+    def route(self, messages):
+        """Next worker for the latest request in messages, or FINISH once it has been answered."""
+        request, replies = _latest_request(messages, self.members)
+        done = tuple(_name(m) for m in replies if _name(m) in self.members)
+        key = (normalize(request), done)
+        with self.lock:
+            decision = self.cache.get(key)
+            if decision is not None:
+                self.cache.move_to_end(key)
+        if decision is not None:
+            return self._count("cache", decision)
+
+        needed = needed_workers(request)
+        tier = "rules"
+        if needed is None and self.classifier is not None:
+            needed, tier = self._classify(request), "local"
+        if needed is not None:
+            decision = next((worker for worker in needed if worker not in done), FINISH)
+        else:
+            decision, tier = self.llm_route(messages), "llm"
+
+        with self.lock:
+            self.cache[key] = decision
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return self._count(tier, decision)
+
+    def plan(self, messages):
+        """{worker: task} to run at the same time, for a latest request none of the members has answered yet
+        that splits into independent parts; None when the request has to go through route()."""
+        request, replies = _latest_request(messages, self.members)
+        if any(_name(m) in self.members for m in replies):
+            return None
+        tasks = independent_parts(request)
+        if tasks is not None:
+            with self.lock:
+                self.metrics["fanout"] += 1
+        return tasks
+
+    def _classify(self, request):
+        try:
+            result = self.classifier(str(request)[:2000])[0]
+        except Exception as e:
+            logger.warning(f"Local router model failed: {e}")
+            return None
+        if result["label"] in self.members and result["score"] >= LOCAL_THRESHOLD:
+            return [result["label"]]
+        return None
+
+    def _count(self, tier, decision):
+        with self.lock:
+            self.metrics[tier] += 1
+            total = sum(self.metrics[tier] for tier in TIERS)
+        if total % LOG_EVERY == 0:
+            logger.info(f"Router decisions: {self.stats()}")
+        return decision
+
+    def stats(self):
+        """{tier: (decisions, share of all decisions)} for each tier, plus the number of fan-outs."""
+        with self.lock:
+            total = sum(self.metrics[tier] for tier in TIERS) or 1
+            stats = {tier: (self.metrics[tier], round(self.metrics[tier] / total, 3)) for tier in TIERS}
+            stats["fanout"] = self.metrics["fanout"]
+            return stats
+
+
+def _latest_request(messages, members):
+    """The latest message from the user, and the messages that came after it."""
+    # Threads are checkpointed across turns, so earlier questions and their answers are still in messages
+    for i in range(len(messages) - 1, -1, -1):
+        # Workers reply as named human messages
+        if _role(messages[i]) in ("user", "human") and _name(messages[i]) not in members:
+            return _content(messages[i]), messages[i + 1:]
+    return "", messages
+
+
+def _role(message):
+    return message.get("role") if isinstance(message, dict) else getattr(message, "type", None)
+
+
+def _content(message):
+    return message.get("content") if isinstance(message, dict) else getattr(message, "content", "")
+
+
+def _name(message):
+    return message.get("name") if isinstance(message, dict) else getattr(message, "name", None)
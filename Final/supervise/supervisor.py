@@ -2,8 +2,11 @@ from typing import Literal
 from typing_extensions import TypedDict
 
 from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import HumanMessage
 from langgraph.graph import MessagesState, END
-from langgraph.types import Command
+from langgraph.types import Command, Send
+
+from router import TieredRouter
 
 
 members = ["researcher", "coder"]
@@ -33,12 +36,26 @@ class State(MessagesState):
     next: str
 
 
-def supervisor_node(state: State) -> Command[Literal[*members, "__end__"]]:
+def llm_route(messages):
     messages = [
         {"role": "system", "content": system_prompt},
-    ] + state["messages"]
+    ] + messages
     response = llm.with_structured_output(Router).invoke(messages)
-    goto = response["next"]
+    return response["next"]
+
+
+# Rules and cached decisions settle most hops; the LLM is only asked when they cannot
+router = TieredRouter(members, llm_route)
+
+
+def supervisor_node(state: State) -> Command[Literal[*members, "__end__"]]:
+    # Independent parts for different workers run at the same time and are back together on the next hop
+    tasks = router.plan(state["messages"])
+    if tasks:
+        return Command(goto=[Send(worker, {"messages": [HumanMessage(content=task)]}) for worker, task in tasks.items()],
+                       update={"next": ",".join(tasks)})
+
+    goto = router.route(state["messages"])
     if goto == "FINISH":
         goto = END
 
@@ -0,0 +1,125 @@
+import re
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+HTTP_METHODS = ("get", "post", "put", "delete")
+MAX_ACTIVE_TOOLS = 8
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "can", "for", "from", "give", "how", "in", "is",
+             "it", "me", "my", "of", "on", "or", "please", "show", "that", "the", "this", "to", "what", "with", "you"}
+
+
+class Endpoint:
+    """One operation of an OpenAPI spec, indexed without building a Tool for it."""
+
+    __slots__ = ("spec_name", "method", "path", "operation", "servers", "name", "tokens")
+
+    def __init__(self, spec_name: str, method: str, path: str, operation: Dict, servers: List[Dict]):
+        self.spec_name = spec_name
+        self.method = method
+        self.path = path
+        self.operation = operation or {}
+        self.servers = servers
+        self.name = tool_name(spec_name, method, path)
+        self.tokens = frozenset(tokenize(self.text()))
+
+    @property
+    def base_url(self) -> str:
+        return (self.servers[0].get("url", "") if self.servers else "").strip().rstrip("/")
+
+    @property
+    def summary(self) -> str:
+        return self.operation.get("summary") or self.operation.get("description") or ""
+
+    def text(self) -> str:
+        """Everything a query might match on: spec, path, summary and parameter names."""
+        params = " ".join(p.get("name", "") for p in self.operation.get("parameters", []) if isinstance(p, dict))
+        return f"{self.spec_name} {self.method} {self.path} {self.summary} {self.operation.get('description', '')} {params}"
+
+
+def iter_endpoints(specs: Dict[str, Dict]) -> Iterable[Endpoint]:
+    """Every operation of every spec that can be a tool, in spec order."""
+    for spec_name, spec in specs.items():
+        servers = spec.get("servers", [])
+        for path, path_item in (spec.get("paths") or {}).items():
+            for method, operation in path_item.items():
+                if method in HTTP_METHODS and not streams_only(operation or {}):
+                    yield Endpoint(spec_name, method, path, operation, servers)
+
+
+def streams_only(operation: Dict) -> bool:
+    # Server-Sent Events endpoints never finish, so a tool call to one would hang
+    for response in (operation.get("responses") or {}).values():
+        content = (response or {}).get("content") or {}
+        if content and all(media == "text/event-stream" for media in content):
+            return True
+    return False
+
+
+def tool_name(spec_name: str, method: str, path: str) -> str:
+    # OpenAI tool names must match ^[a-zA-Z0-9_-]{1,64}$
+    stem = spec_name.rsplit(".", 1)[0]
+    slug = re.sub(r"[^a-zA-Z0-9]+", "_", path).strip("_") or "root"
+    return f"{stem}_{method}_{slug}"[:64]
+
+
+def tokenize(text: str) -> List[str]:
+    # Split camelCase and path segments so "stressResults" matches "stress results"
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def keyword_ranker(query: str, endpoints: List[Endpoint]) -> List[str]:
+    """Endpoint names ordered by how many query words they mention; non-matching endpoints are left out."""
+    words = set(tokenize(query))
+    scored = []
+    for i, endpoint in enumerate(endpoints):
+        score = len(words & endpoint.tokens)
+        if score:
+            scored.append((-score, i, endpoint.name))
+    return [name for _, _, name in sorted(scored)]
+
+
+class ToolRegistry:
+    """Indexes every endpoint once; Tools and their OpenAI schemas are built on first use and cached."""
+
+    def __init__(self, specs: Dict[str, Dict], tool_factory: Callable[[Endpoint], object],
+                 extra_tools: Iterable = (), ranker: Callable[[str, List[Endpoint]], List[str]] = keyword_ranker):
+        self.tool_factory = tool_factory
+        self.ranker = ranker
+        self.endpoints: Dict[str, Endpoint] = {endpoint.name: endpoint for endpoint in iter_endpoints(specs)}
+        self.tools = {tool.name: tool for tool in extra_tools}
+        self.always_active = list(self.tools)
+        self.schemas: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def names(self) -> List[str]:
+        return self.always_active + list(self.endpoints)
+
+    def get(self, name: str):
+        tool = self.tools.get(name)
+        if tool is not None:
+            return tool
+        with self.lock:
+            tool = self.tools.get(name)
+            if tool is None:
+                tool = self.tools[name] = self.tool_factory(self.endpoints[name])
+        return tool
+
+    def openai_tool(self, name: str) -> Dict:
+        schema = self.schemas.get(name)
+        if schema is None:
+            schema = self.schemas[name] = convert_to_openai_tool(self.get(name))
+        return schema
+
+    def openai_tools(self, names: Iterable[str]) -> List[Dict]:
+        return [self.openai_tool(name) for name in names]
+
+    def select(self, query: str, limit: Optional[int] = MAX_ACTIVE_TOOLS) -> List[str]:
+        """Names of the tools to offer for this query: the always-on tools plus the best matching endpoints."""
+        ranked = self.ranker(query, list(self.endpoints.values()))
+        if not ranked:
+            # Nothing matched; offer endpoints in spec order rather than none at all
+            ranked = list(self.endpoints)
+        return self.always_active + ranked[:limit]
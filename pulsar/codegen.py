@@ -0,0 +1,198 @@
+import hashlib
+import importlib.util
+import keyword
+import os
+import pprint
+import re
+import threading
+
+import yaml
+
+# Compiles OpenAPI specs into plain Python client modules.
+# Every operation becomes a typed function plus an OpenAI tool schema, so the model
+# only picks an operation and its arguments instead of writing requests code. The
+# generated module is written to CODEGEN_DIR under the hash of the spec text and
+# imported from there; a spec is only compiled again when its content changes.
+
+CODEGEN_DIR = os.getenv('CODEGEN_DIR', '.codegen')
+GENERATOR_VERSION = '1'  # bump when the generated code changes shape
+HTTP_METHODS = ('get', 'post', 'put', 'patch', 'delete')
+PYTHON_TYPES = {'string': 'str', 'integer': 'int', 'number': 'float', 'boolean': 'bool',
+                'array': 'list', 'object': 'dict'}
+
+MODULE_HEADER = '''# Generated by codegen.py from {filename} (sha256 {digest}). Do not edit.
+from typing import Any, Optional
+from urllib.parse import quote
+
+import requests
+
+BASE_URL = {base_url!r}
+TIMEOUT = 30
+_session = requests.Session()
+
+
+def _path(template, values):
+    return template.format(**{{name: quote(str(value), safe='') for name, value in values.items()}})
+
+
+def _call(method, path, params=None, body=None):
+    params = {{k: v for k, v in (params or {{}}).items() if v is not None}}
+    response = _session.request(method, BASE_URL + path, params=params or None, json=body, timeout=TIMEOUT)
+    response.raise_for_status()
+    if 'json' in response.headers.get('Content-Type', ''):
+        return response.json()
+    return response.text'''
+
+_modules = {}
+_lock = threading.Lock()
+
+
+def _identifier(name):
+    name = re.sub(r'\W+', '_', name).strip('_') or 'arg'
+    if name[0].isdigit():
+        name = f'_{name}'
+    return f'{name}_' if keyword.iskeyword(name) else name
+
+
+def _resolve(spec, node):
+    while isinstance(node, dict) and '$ref' in node:
+        target = spec
+        for part in node['$ref'].lstrip('#/').split('/'):
+            target = target.get(part, {})
+        node = target
+    return node or {}
+
+
+def _streams_only(operation):
+    # Server-Sent Events endpoints never finish, so they get no client function
+    for response in (operation.get('responses') or {}).values():
+        content = (response or {}).get('content') or {}
+        if content and all(media == 'text/event-stream' for media in content):
+            return True
+    return False
+
+
+def _arguments(spec, operation):
+    """(python name, wire name, location, required, schema, description) for every input of an operation."""
+    arguments = []
+    for param in operation.get('parameters', []):
+        param = _resolve(spec, param)
+        arguments.append((_identifier(param['name']), param['name'], param.get('in', 'query'),
+                          bool(param.get('required')) or param.get('in') == 'path',
+                          _resolve(spec, param.get('schema')), param.get('description', '')))
+    body = _resolve(spec, operation.get('requestBody'))
+    schema = _resolve(spec, ((body.get('content') or {}).get('application/json') or {}).get('schema'))
+    required = set(schema.get('required', []))
+    for name, prop in (schema.get('properties') or {}).items():
+        prop = _resolve(spec, prop)
+        arguments.append((_identifier(name), name, 'body', name in required, prop, prop.get('description', '')))
+    return arguments
+
+
+def _tool_schema(name, summary, arguments):
+    properties = {}
+    for py_name, _, _, _, schema, description in arguments:
+        prop = {'type': schema.get('type', 'string')}
+        if description:
+            prop['description'] = description
+        if 'enum' in schema:
+            prop['enum'] = schema['enum']
+        if prop['type'] == 'array':
+            prop['items'] = {'type': _resolve({}, schema.get('items')).get('type', 'string')}
+        properties[py_name] = prop
+    return {'type': 'function', 'function': {
+        'name': name,
+        'description': summary,
+        'parameters': {'type': 'object', 'properties': properties,
+                       'required': [a[0] for a in arguments if a[3]]},
+    }}
+
+
+def _function_source(name, method, path, summary, arguments):
+    ordered = sorted(arguments, key=lambda a: not a[3])  # required first
+    signature = ', '.join(
+        f"{a[0]}: {PYTHON_TYPES.get(a[4].get('type'), 'Any')}" if a[3]
+        else f"{a[0]}: Optional[{PYTHON_TYPES.get(a[4].get('type'), 'Any')}] = None"
+        for a in ordered)
+    path_values = ', '.join(f'{wire!r}: {py}' for py, wire, where, *_ in arguments if where == 'path')
+    query = ', '.join(f'{wire!r}: {py}' for py, wire, where, *_ in arguments if where == 'query')
+    body = [(py, wire, required) for py, wire, where, required, *_ in arguments if where == 'body']
+    docstring = summary.replace('\\', '\\\\').replace('"', '\\"')
+    lines = [f'def {name}({signature}) -> Any:', f'    """{docstring}"""']
+    path_expr = f'_path({path!r}, {{{path_values}}})' if path_values else repr(path)
+    call = [repr(method.upper()), path_expr]
+    if query:
+        call.append(f'params={{{query}}}')
+    if body:
+        lines.append(f"    body = {{{', '.join(f'{wire!r}: {py}' for py, wire, _ in body)}}}")
+        lines.append('    body = {k: v for k, v in body.items() if v is not None}')
+        call.append('body=body')
+    lines.append(f"    return _call({', '.join(call)})")
+    return '\n'.join(lines)
+
+
+def generate_source(filename, spec, digest):
+    """Source of the client module for one parsed spec."""
+    servers = spec.get('servers') or [{}]
+    parts = [MODULE_HEADER.format(filename=filename, digest=digest, base_url=servers[0].get('url', '').rstrip('/'))]
+    tools = []
+    for path, path_item in (spec.get('paths') or {}).items():
+        for method, operation in path_item.items():
+            if method not in HTTP_METHODS or _streams_only(operation or {}):
+                continue
+            operation = operation or {}
+            name = _identifier(operation.get('operationId') or f'{method} {path}')
+            summary = operation.get('summary') or operation.get('description') or f'{method.upper()} {path}'
+            arguments = _arguments(spec, operation)
+            parts.append(_function_source(name, method, path, summary, arguments))
+            tools.append(_tool_schema(name, summary, arguments))
+    parts.append(f'TOOLS = {pprint.pformat(tools, width=120, sort_dicts=False)}')
+    return '\n\n\n'.join(parts) + '\n'
+
+
+def compile_spec(filename, text):
+    """Import the client module for a spec, generating it first if this spec content has not been seen."""
+    digest = hashlib.sha256(f'{GENERATOR_VERSION}\0{text}'.encode()).hexdigest()
+    with _lock:
+        module = _modules.get(digest)
+        if module is not None:
+            return module
+        module_name = f"{_identifier(filename.rsplit('.', 1)[0])}_{digest[:16]}"
+        path = os.path.join(CODEGEN_DIR, f'{module_name}.py')
+        if not os.path.exists(path):
+            source = generate_source(filename, yaml.safe_load(text), digest)
+            os.makedirs(CODEGEN_DIR, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(source)
+            os.replace(tmp_path, path)
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[digest] = module
+        return module
+
+
+def compile_specs(specs):
+    """{filename: client module} for a dict of spec texts, as returned by run_logic.read_openapi_specs."""
+    clients = {}
+    for filename, text in specs.items():
+        try:
+            clients[filename] = compile_spec(filename, text)
+        except Exception as e:
+            print(f"Error compiling client for {filename}: {e}")
+    return clients
+
+
+def openai_tools(clients):
+    """Tool schemas for every operation of every client."""
+    return [tool for client in clients.values() for tool in client.TOOLS]
+
+
+def call(clients, name, arguments):
+    """Call the generated function name with the model's arguments."""
+    for client in clients.values():
+        function = getattr(client, name, None)
+        if callable(function) and any(t['function']['name'] == name for t in client.TOOLS):
+            return function(**arguments)
+    raise KeyError(f"Unknown operation {name}")
@@ -0,0 +1,151 @@
+import json
+import os
+import queue
+import select
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Pool of warm Python workers (exec_worker.py) for running generated scripts.
+# Each script runs in its own process forked from a worker, with its own
+# workspace directory, a wall-clock timeout, a CPU-time limit and an
+# address-space limit. A worker is replaced after MAX_TASKS scripts, or straight
+# away if it stops answering or its reply cannot be read.
+
+POOL_SIZE = int(os.getenv('EXEC_POOL_SIZE', 2))
+MAX_TASKS = int(os.getenv('EXEC_MAX_TASKS', 50))
+TIMEOUT = float(os.getenv('EXEC_TIMEOUT', 30))
+CPU_SECONDS = int(os.getenv('EXEC_CPU_SECONDS', 20))
+MEMORY_MB = int(os.getenv('EXEC_MEMORY_MB', 1024))
+WORKSPACE_ROOT = os.getenv('EXEC_WORKSPACE_ROOT', tempfile.gettempdir())
+START_TIMEOUT = 60
+REPLY_GRACE = 5  # seconds a worker gets past the script timeout to kill the script and reply
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exec_worker.py')
+
+
+class ExecResult:
+    def __init__(self, stdout='', stderr='', error=None):
+        self.stdout = stdout
+        self.stderr = stderr
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class Worker:
+    def __init__(self):
+        self.proc = subprocess.Popen([sys.executable, WORKER_SCRIPT], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     text=True, bufsize=1, env={**os.environ, 'EXEC_MEMORY_MB': str(MEMORY_MB)})
+        self.tasks = 0
+        if self._read(START_TIMEOUT) is None:
+            self.kill()
+            raise RuntimeError('exec worker failed to start')
+
+    def _read(self, timeout):
+        ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+        if not ready:
+            return None
+        line = self.proc.stdout.readline()
+        try:
+            return json.loads(line) if line else None
+        except ValueError:
+            return None
+
+    def run(self, code, workspace, timeout, cpu_seconds):
+        self.tasks += 1
+        request = {'code': code, 'workspace': workspace, 'timeout': timeout, 'cpu_seconds': cpu_seconds}
+        try:
+            self.proc.stdin.write(json.dumps(request) + '\n')
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            return None
+        return self._read(timeout + REPLY_GRACE)
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def kill(self):
+        if self.alive():
+            self.proc.kill()
+        self.proc.wait()
+
+
+class ExecPool:
+    def __init__(self, size=POOL_SIZE, max_tasks=MAX_TASKS):
+        self.size = size
+        self.max_tasks = max_tasks
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self._spawn()
+
+    def _spawn(self):
+        try:
+            self.idle.put(Worker())
+        except Exception as e:
+            print(f"Could not start exec worker: {e}")
+            # Keep the slot so a later execute() retries the start instead of waiting forever
+            self.idle.put(None)
+
+    def _replace(self, worker):
+        if worker is not None:
+            worker.kill()
+        # Start the replacement in the background so the caller is not charged for the cold start
+        threading.Thread(target=self._spawn, daemon=True).start()
+
+    def execute(self, code, timeout=TIMEOUT, cpu_seconds=CPU_SECONDS):
+        """Run code on a warm worker in a fresh workspace and return an ExecResult."""
+        worker = self.idle.get()
+        if worker is None:
+            try:
+                worker = Worker()
+            except Exception as e:
+                self.idle.put(None)
+                return ExecResult(error=f'Could not start exec worker: {e}')
+        reply = None
+        start = time.monotonic()
+        try:
+            workspace = tempfile.mkdtemp(prefix='exec_', dir=WORKSPACE_ROOT)
+            try:
+                reply = worker.run(code, workspace, timeout, cpu_seconds)
+            finally:
+                shutil.rmtree(workspace, ignore_errors=True)
+        finally:
+            # The slot always goes back, to this worker or its replacement
+            if reply is None or worker.tasks >= self.max_tasks or not worker.alive():
+                self._replace(worker)
+            else:
+                self.idle.put(worker)
+
+        if reply is None:
+            if time.monotonic() - start >= timeout:
+                return ExecResult(error=f'Timed out after {timeout}s')
+            return ExecResult(error='Exec worker exited or sent an unreadable reply')
+        return ExecResult(reply.get('stdout', ''), reply.get('stderr', ''), reply.get('error'))
+
+    def shutdown(self):
+        for _ in range(self.size):
+            try:
+                worker = self.idle.get(timeout=START_TIMEOUT)
+            except queue.Empty:
+                break
+            if worker is not None:
+                worker.kill()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The process-wide ExecPool, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExecPool()
+        return _pool
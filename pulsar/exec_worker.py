@@ -0,0 +1,148 @@
+# Long-lived interpreter for exec_pool.
+# Started once with the common modules already imported, then runs one script per
+# request read from stdin. Every script runs in a child forked from this warm
+# process, so it starts from the preloaded modules but nothing it changes (module
+# state, monkeypatches, limits) survives it. Requests and replies are single JSON
+# lines written only by this parent; the script's own stdout/stderr (including
+# child processes) and its error go to files in its workspace.
+import json
+import os
+import resource
+import signal
+import sys
+import time
+import traceback
+
+PRELOAD = ('json', 'requests', 'pandas')
+POLL_INTERVAL = 0.01
+
+# Bound before any script runs, so patching the json module cannot touch the protocol
+_dumps = json.dumps
+_loads = json.loads
+
+for name in PRELOAD:
+    try:
+        __import__(name)
+    except ImportError:
+        pass
+
+
+def limit_cpu(seconds):
+    # RLIMIT_CPU counts the whole process, so the limit is set relative to what we have used so far
+    used = resource.getrusage(resource.RUSAGE_SELF)
+    spent = int(used.ru_utime + used.ru_stime) + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = spent + seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def limit_memory(megabytes):
+    # Set after the preloads so the limit only has to cover what scripts allocate on top of them
+    limit = megabytes * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def run_script(request, out_path, err_path, error_path, private_fds):
+    """Body of the forked child: run the script with its output redirected, then exit without cleanup."""
+    status = 1
+    try:
+        # Own process group, so the parent can stop anything the script started
+        os.setpgid(0, 0)
+        for fd in private_fds:
+            os.close(fd)
+        with open(out_path, 'w') as out, open(err_path, 'w') as err:
+            os.dup2(out.fileno(), 1)
+            os.dup2(err.fileno(), 2)
+        error = None
+        try:
+            os.chdir(request['workspace'])
+            limit_cpu(request['cpu_seconds'])
+            if os.getenv('EXEC_MEMORY_MB'):
+                limit_memory(int(os.environ['EXEC_MEMORY_MB']))
+            code = compile(request['code'], 'script.py', 'exec')
+            exec(code, {'__name__': '__main__', '__builtins__': __builtins__})
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                error = f'SystemExit: {e.code}'
+        except BaseException:
+            error = traceback.format_exc(limit=-5)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if error is not None:
+            with open(error_path, 'w') as f:
+                f.write(error)
+        status = 0
+    finally:
+        os._exit(status)
+
+
+def wait(pid, timeout):
+    """Exit status of the child pid, or None if it is still running after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while True:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            return status
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(POLL_INTERVAL)
+
+
+def kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def read(path):
+    try:
+        with open(path, errors='replace') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def run(request, protocol, private_fds):
+    workspace = request['workspace']
+    out_path = os.path.join(workspace, '.stdout')
+    err_path = os.path.join(workspace, '.stderr')
+    error_path = os.path.join(workspace, '.error')
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        run_script(request, out_path, err_path, error_path, private_fds)
+    status = wait(pid, request['timeout'])
+    if status is None:
+        kill_group(pid)
+        os.waitpid(pid, 0)
+        error = f"Timed out after {request['timeout']}s"
+    else:
+        kill_group(pid)  # background processes the script left behind
+        if os.WIFSIGNALED(status) or os.WEXITSTATUS(status) != 0:
+            error = 'Script was killed (CPU or memory limit exceeded)'
+        else:
+            error = read(error_path)
+    reply = {'stdout': read(out_path) or '', 'stderr': read(err_path) or '', 'error': error}
+    protocol.write(_dumps(reply) + '\n')
+    protocol.flush()
+
+
+def main():
+    # Requests and replies use private copies of stdin/stdout so scripts cannot read or corrupt the protocol
+    requests_in = os.fdopen(os.dup(0), 'r')
+    protocol = os.fdopen(os.dup(1), 'w')
+    os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+    protocol.write(_dumps({'ready': True}) + '\n')
+    protocol.flush()
+    private_fds = (requests_in.fileno(), protocol.fileno())
+    for line in requests_in:
+        run(_loads(line), protocol, private_fds)
+
+
+if __name__ == '__main__':
+    main()
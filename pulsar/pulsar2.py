@@ -1,8 +1,10 @@
 import os
+import json
+import codegen
 from dotenv import load_dotenv
 from openai import OpenAI
 import gradio as gr
-from run_logic import read_openapi_specs, create_api_scripts, execute_script
+from run_logic import read_openapi_specs
 
 load_dotenv(override=True)
 openai_api_key = os.getenv('OPENAI_API_KEY')
@@ -16,19 +18,45 @@ MODEL = 'gpt-4o-mini'
 system_message = "You are a Finance and Risk Management expert with expert python skills."
 system_message += "You are tasked with responding to credit officers questions."
 system_message += "You have access to open API specifications of the application."
-system_message += "You will interpret user questions and write python code to trigger corresponding REST endpoints."
-system_message += "Once python execution completed you will display the response to the user in a easily understandble format."
+system_message += "You will interpret user questions and call the matching API operation with the right arguments."
+system_message += "If the question does not need the API, answer it directly."
+
+
+def format_result(result):
+    """Renders an API response for the chat: a table for lists of records, key: value lines for a record."""
+    if isinstance(result, list) and result and all(isinstance(row, dict) for row in result):
+        columns = list(dict.fromkeys(key for row in result for key in row))
+        lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+        lines += ["| " + " | ".join(str(row.get(column, "")) for column in columns) + " |" for row in result]
+        return "\n".join(lines)
+    if isinstance(result, dict):
+        return "\n".join(f"- **{key}**:\n\n{format_result(value)}\n" if isinstance(value, (list, dict))
+                         else f"- **{key}**: {value}" for key, value in result.items())
+    return str(result)
 
 
 def chat(message,history):
     specs = read_openapi_specs("swagger_yamls")
+    # Client functions are generated once per spec content; the model only picks the operation and arguments
+    clients = codegen.compile_specs(specs)
 
+    history = [{"role": m["role"], "content": m["content"]} for m in history]
     messages = [{"role": "system", "content": system_message}] + history + [{"role": "user", "content": message}]
     response = openai.chat.completions.create(
         model=MODEL,
-        messages=messages
+        messages=messages,
+        tools=codegen.openai_tools(clients)
     )
-    script = response.choices[0].message.content
-    execute_script(script)
+    reply = response.choices[0].message
+    if not reply.tool_calls:
+        return reply.content
+    answers = []
+    for tool_call in reply.tool_calls:
+        try:
+            result = codegen.call(clients, tool_call.function.name, json.loads(tool_call.function.arguments or "{}"))
+            answers.append(format_result(result))
+        except Exception as e:
+            answers.append(f"{tool_call.function.name} failed: {e}")
+    return "\n\n".join(answers)
 
 gr.ChatInterface(fn=chat, title="Pulsar Chatbot", type="messages",description="Explore SuperNova with Pulsar").launch()
@@ -1,38 +1,40 @@
 # Function to read Swagger OpenAPI specifications from a folder
 import os
-import subprocess
+import codegen
+import exec_pool
+
+# path -> ((mtime_ns, size), text); specs are only re-read after they change on disk
+_spec_cache = {}
 
 def read_openapi_specs(folder_path):
     specs = {}
     for filename in os.listdir(folder_path):
         if filename.endswith(".yaml") or filename.endswith(".json"):
-            with open(os.path.join(folder_path, filename), 'r') as file:
-                specs[filename] = file.read()
+            path = os.path.join(folder_path, filename)
+            stat = os.stat(path)
+            key = (stat.st_mtime_ns, stat.st_size)
+            cached = _spec_cache.get(path)
+            if cached is None or cached[0] != key:
+                with open(path, 'r') as file:
+                    cached = _spec_cache[path] = (key, file.read())
+            specs[filename] = cached[1]
     return specs
 
 
 
-# Function to create Python scripts to execute API endpoints
+# Function to create Python client code for the API endpoints
 def create_api_scripts(specs):
+    """Client module source per spec: one typed function per operation, compiled once per spec content."""
     scripts = {}
-    for filename, spec in specs.items():
-        # Here you would parse the OpenAPI spec and generate the Python script
-        # For simplicity, we'll just create a dummy script
-        script_content = f"""
-import requests
-
-def call_api():
-    response = requests.get('http://example.com/api')
-    return response.json()
-"""
-        scripts[filename] = script_content
+    for filename, client in codegen.compile_specs(specs).items():
+        with open(client.__file__) as file:
+            scripts[filename] = file.read()
     return scripts
 
 
-# Function to execute a Python script in a subprocess
-def execute_script(script_content):
-    with open("temp_script.py", "w") as file:
-        file.write(script_content)
-    result = subprocess.run(["python", "temp_script.py"], capture_output=True, text=True)
-    #os.remove("temp_script.py")
+# Function to execute a Python script on a warm, sandboxed worker
+def execute_script(script_content, timeout=exec_pool.TIMEOUT):
+    result = exec_pool.get_pool().execute(script_content, timeout=timeout)
+    if result.error:
+        return f"{result.stdout}{result.error}"
     return result.stdout